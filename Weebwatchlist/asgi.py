@@ -2,6 +2,8 @@
 ASGI config for Weebwatchlist project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with ``SERVER_MODE=asgi ./start.sh`` (or directly with
+``uvicorn Weebwatchlist.asgi:application``) to serve the async views natively.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
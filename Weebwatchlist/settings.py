@@ -139,4 +139,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
-TIME_ZONE = 'Asia/Kolkata'
\ No newline at end of file
+TIME_ZONE = 'Asia/Kolkata'
+
+# Shared by every worker process: explore pages, Jikan responses and the
+# locks that coalesce concurrent Jikan fetches. Create the table
+# with `manage.py createcachetable` (start.sh does).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    },
+}
+
+# Jikan API client (see application/jikan.py)
+# Cache shared by all workers for Jikan responses and for coalescing their
+# concurrent fetches of one URL. Set it to a Redis/memcached alias when one is
+# configured, or to an empty string to keep only each worker's own LRU.
+JIKAN_CACHE_ALIAS = os.environ.get("JIKAN_CACHE_ALIAS", "default") or None
+JIKAN_LRU_SIZE = int(os.environ.get("JIKAN_LRU_SIZE", 512))
+JIKAN_STALE_TTL = int(os.environ.get("JIKAN_STALE_TTL", 24 * 60 * 60))
+# Async views call Jikan with a pooled httpx.AsyncClient per event loop. Only
+# worth it under ASGI (SERVER_MODE=asgi), where the loop lives as long as the
+# worker; under WSGI they use the pooled requests session in a thread.
+JIKAN_ASYNC_HTTP = os.environ.get("JIKAN_ASYNC_HTTP", str(os.environ.get("SERVER_MODE") == "asgi")).lower() in ("1", "true", "yes")
+# Cache holding the Jikan rate-limit counters shared by all workers; needs
+# atomic incr (Redis/memcached, not the database cache). When unset the
+# counters are kept in the RateLimitWindow table.
+JIKAN_RATE_LIMIT_CACHE_ALIAS = os.environ.get("JIKAN_RATE_LIMIT_CACHE_ALIAS") or None
+# Processed explore pages are cached per filter set here; it must be shared
+# so every worker serves the same pages
+EXPLORE_CACHE_ALIAS = os.environ.get("EXPLORE_CACHE_ALIAS", "default")
+# Background fetches of the next explore page allowed at once (0 disables them)
+EXPLORE_PREFETCH_LIMIT = int(os.environ.get("EXPLORE_PREFETCH_LIMIT", 2))
+
+# Background job queue (see application/jobs.py), run with `manage.py run_workers`
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+JOB_LOCK_TIMEOUT = int(os.environ.get("JOB_LOCK_TIMEOUT", 10 * 60))
+JOB_KEEP_FINISHED_DAYS = int(os.environ.get("JOB_KEEP_FINISHED_DAYS", 7))
+# Likes/comments/follows on one target within this many seconds become one notification update
+NOTIFICATION_DELIVERY_DELAY = int(os.environ.get("NOTIFICATION_DELIVERY_DELAY", 30))
+# Live like/comment counts over Server-Sent Events (see application/realtime.py).
+# Streams hold a connection open, so they are only served under ASGI by default.
+REALTIME_ENABLED = os.environ.get("REALTIME_ENABLED", str(os.environ.get("SERVER_MODE") == "asgi")).lower() in ("1", "true", "yes")
+# LocalBroadcaster is enough for a single worker; PollingBroadcaster also sees other workers' writes
+REALTIME_BACKEND = os.environ.get("REALTIME_BACKEND", "application.realtime.PollingBroadcaster")
+REALTIME_POLL_INTERVAL = float(os.environ.get("REALTIME_POLL_INTERVAL", 3.0))
@@ -0,0 +1,219 @@
+"""
+Local anime catalog backed by the ``Anime`` table.
+
+Views read anime metadata from here with a primary-key lookup. A record is
+fetched from Jikan only the first time it is needed or once it is older
+than ``CATALOG_MAX_AGE``; the ``populate_anime_catalog`` management command
+can warm it ahead of time.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import timedelta
+
+from django.db import connections
+from django.utils import timezone
+
+from application import jikan
+from application.models import Anime
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAX_AGE = timedelta(days=7)
+# anime_details.html only renders this many characters
+CHARACTER_LIMIT = 10
+# Seconds a detail page waits for characters before rendering without them
+CHARACTERS_TIMEOUT = 1.5
+CHARACTERS_GRACE = 0.25
+
+# Runs Jikan calls alongside the request thread. The Jikan client's rate
+# limiter and shared cache use the database, so each task closes its
+# connections before the thread goes back to the pool.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='catalog')
+
+STATUS_COLOR_MAP = {
+    "Finished Airing": {'label': 'completed', 'class': 'bg-green-600'},
+    "Currently Airing": {'label': 'ongoing', 'class': 'bg-blue-600'},
+    "Not yet aired": {'label': 'upcoming', 'class': 'bg-yellow-600'},
+}
+UNKNOWN_STATUS = {'label': 'unknown', 'class': 'bg-gray-500'}
+
+
+def status_color(status):
+    return STATUS_COLOR_MAP.get(status, UNKNOWN_STATUS)
+
+
+def fields_from_jikan(data):
+    """Map a Jikan ``/anime/{id}`` payload onto ``Anime`` column values."""
+    return {
+        'title': data.get('title') or '',
+        'title_english': data.get('title_english') or '',
+        'image_url': (data.get('images') or {}).get('webp', {}).get('large_image_url') or '',
+        'status': data.get('status') or '',
+        'score': data.get('score'),
+        'episodes': data.get('episodes') or 0,
+        'genres': [genre['name'] for genre in data.get('genres') or []],
+        'synopsis': data.get('synopsis') or '',
+        'trailer_url': (data.get('trailer') or {}).get('url') or '',
+        'data': data,
+        'fetched_at': timezone.now(),
+    }
+
+
+def trim_characters(characters):
+    """Keep only the characters and fields anime_details.html renders."""
+    return [
+        {
+            'role': entry.get('role'),
+            'character': {
+                'name': character.get('name'),
+                'images': {'jpg': {'image_url': character.get('images', {}).get('jpg', {}).get('image_url')}},
+            },
+        }
+        for entry in characters[:CHARACTER_LIMIT]
+        for character in [entry.get('character') or {}]
+    ]
+
+
+def is_stale(fetched_at):
+    return fetched_at is None or timezone.now() - fetched_at > CATALOG_MAX_AGE
+
+
+def fetch_characters(mal_id):
+    """Fetch the characters for ``mal_id``; runs on ``_executor``."""
+    try:
+        return trim_characters(jikan.get(f'anime/{mal_id}/characters').get('data', []))
+    finally:
+        connections.close_all()
+
+
+def refresh_anime(mal_id, with_characters=False, anime=None, characters_timeout=CHARACTERS_TIMEOUT):
+    """
+    Fetch ``mal_id`` from Jikan and upsert it into the catalog.
+
+    Passing the existing ``anime`` row skips the detail request while it is
+    still fresh. When characters are requested they are fetched concurrently
+    with the detail; if they aren't back within ``characters_timeout`` seconds
+    (None waits indefinitely) the row is saved without them and the next view
+    picks them up from the Jikan cache.
+    """
+    started = time.monotonic()
+    characters = _executor.submit(fetch_characters, mal_id) if with_characters else None
+
+    defaults = {}
+    if anime is None or is_stale(anime.fetched_at):
+        defaults = fields_from_jikan(jikan.get(f'anime/{mal_id}')['data'])
+
+    if characters is not None:
+        try:
+            remaining = None
+            if characters_timeout is not None:
+                remaining = max(started + characters_timeout - time.monotonic(), CHARACTERS_GRACE)
+            defaults['characters'] = characters.result(timeout=remaining)
+            defaults['characters_fetched_at'] = timezone.now()
+        except (FutureTimeout, jikan.JikanError) as exc:
+            logger.info("Rendering anime %s without characters: %r", mal_id, exc)
+
+    if not defaults:
+        return anime
+    anime, created = Anime.objects.update_or_create(mal_id=mal_id, defaults=defaults)
+    return anime
+
+
+def get_anime(mal_id, with_characters=False):
+    """
+    Return the catalog ``Anime`` for ``mal_id``, fetching it from Jikan if it
+    is missing or stale. Raises ``JikanError`` only when there is no local
+    copy to fall back on.
+    """
+    anime = Anime.objects.filter(mal_id=mal_id).first()
+    needs_characters = with_characters and (anime is None or is_stale(anime.characters_fetched_at))
+    if anime is not None and not is_stale(anime.fetched_at) and not needs_characters:
+        return anime
+
+    try:
+        return refresh_anime(mal_id, with_characters=needs_characters, anime=anime)
+    except jikan.JikanError:
+        if anime is None:
+            raise
+        return anime
+
+
+
+async def afetch_characters(mal_id):
+    return trim_characters((await jikan.aget(f'anime/{mal_id}/characters')).get('data', []))
+
+
+async def arefresh_anime(mal_id, with_characters=False, anime=None, characters_timeout=CHARACTERS_TIMEOUT):
+    """Async counterpart of ``refresh_anime`` for async views."""
+    started = time.monotonic()
+    characters = asyncio.ensure_future(afetch_characters(mal_id)) if with_characters else None
+
+    defaults = {}
+    try:
+        if anime is None or is_stale(anime.fetched_at):
+            defaults = fields_from_jikan((await jikan.aget(f'anime/{mal_id}'))['data'])
+    except BaseException:
+        if characters is not None:
+            characters.cancel()
+        raise
+
+    if characters is not None:
+        try:
+            remaining = None
+            if characters_timeout is not None:
+                remaining = max(started + characters_timeout - time.monotonic(), CHARACTERS_GRACE)
+            # Shielded so the timeout doesn't cancel the fetch. Under ASGI the event
+            # loop outlives the request and a slow response still lands in the Jikan
+            # cache for the next view; under WSGI the loop closes with the request
+            # and the fetch is dropped.
+            defaults['characters'] = await asyncio.wait_for(asyncio.shield(characters), timeout=remaining)
+            defaults['characters_fetched_at'] = timezone.now()
+        except (asyncio.TimeoutError, jikan.JikanError) as exc:
+            logger.info("Rendering anime %s without characters: %r", mal_id, exc)
+
+    if not defaults:
+        return anime
+    anime, created = await Anime.objects.aupdate_or_create(mal_id=mal_id, defaults=defaults)
+    return anime
+
+
+async def aget_anime(mal_id, with_characters=False):
+    """Async counterpart of ``get_anime`` for async views."""
+    anime = await Anime.objects.filter(mal_id=mal_id).afirst()
+    needs_characters = with_characters and (anime is None or is_stale(anime.characters_fetched_at))
+    if anime is not None and not is_stale(anime.fetched_at) and not needs_characters:
+        return anime
+
+    try:
+        return await arefresh_anime(mal_id, with_characters=needs_characters, anime=anime)
+    except jikan.JikanError:
+        if anime is None:
+            raise
+        return anime
+
+# Columns refreshed by bulk upserts; characters are left to refresh_anime
+BULK_UPDATE_FIELDS = [
+    'title', 'title_english', 'image_url', 'status', 'score', 'episodes',
+    'genres', 'synopsis', 'trailer_url', 'data', 'fetched_at',
+]
+
+
+def bulk_upsert(items, batch_size=500):
+    """
+    Insert or update catalog rows from a list of Jikan anime payloads with a
+    single ``INSERT ... ON CONFLICT`` per batch. Returns the number of rows written.
+    """
+    rows = {}
+    for data in items:
+        if data.get('mal_id'):
+            rows[data['mal_id']] = Anime(mal_id=data['mal_id'], **fields_from_jikan(data))
+    Anime.objects.bulk_create(
+        rows.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['mal_id'],
+        update_fields=BULK_UPDATE_FIELDS,
+    )
+    return len(rows)
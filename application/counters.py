@@ -0,0 +1,87 @@
+"""
+Denormalized counters on ``AllPosts`` and ``Comment``.
+
+Counters are adjusted in the same transaction as the row that changes them,
+using ``F()`` expressions so concurrent writers never overwrite each other.
+``reconcile_post_counts`` recomputes them from the source tables to repair
+any drift; comment writes schedule it for their post as a background job.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from application import jobs
+from application.models import AllPosts, Comment
+
+# Comment writes on a post within this window share one reconciliation job
+RECONCILE_DELAY = 60
+
+
+def adjust_comments_count(post_id, delta):
+    posts = AllPosts.objects.filter(pk=post_id)
+    if delta < 0:
+        # Never drive a drifted counter below zero
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def schedule_reconcile(post_id):
+    jobs.enqueue('reconcile_post_counts', key=f'reconcile_post_counts:{post_id}', delay=RECONCILE_DELAY, post_id=post_id)
+
+
+def toggle_like(like_model, parent_model, parent_field, parent_id, user):
+    """
+    Like or unlike ``parent_id`` for ``user`` in one transaction and return
+    ``(liked, likes_count)``.
+
+    Relies on the like model's ``unique_together`` constraint instead of a
+    read-then-write check, and moves ``likes_count`` by one with ``F()``.
+    Raises ``parent_model.DoesNotExist`` if the parent is gone.
+    """
+    parents = parent_model.objects.filter(pk=parent_id)
+    lookup = {'user': user, f'{parent_field}_id': parent_id}
+    with transaction.atomic():
+        deleted, _ = like_model.objects.filter(**lookup).delete()
+        if deleted:
+            liked, delta = False, -1
+        else:
+            try:
+                with transaction.atomic():
+                    like_model.objects.create(**lookup)
+                liked, delta = True, 1
+            except IntegrityError:
+                # A concurrent request inserted the same like first
+                liked, delta = True, 0
+
+        if delta > 0:
+            updated = parents.update(likes_count=F('likes_count') + 1)
+        elif delta < 0:
+            updated = parents.update(likes_count=Greatest(F('likes_count') - 1, 0))
+        else:
+            updated = 1
+        if not updated:
+            raise parent_model.DoesNotExist
+        likes_count = parents.values_list('likes_count', flat=True).get()
+    return liked, likes_count
+
+
+def _count_subquery(model, fk):
+    counts = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def reconcile_post_counts(post_ids=None):
+    """
+    Recompute ``comments_count`` for posts whose stored value has drifted.
+    Returns the number of posts that were corrected.
+    """
+    posts = AllPosts.objects.all()
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+
+    actual = _count_subquery(Comment, 'post')
+    drifted = posts.annotate(actual_comments=actual).filter(~Q(comments_count=F('actual_comments')))
+    drifted_ids = list(drifted.values_list('pk', flat=True))
+    if drifted_ids:
+        AllPosts.objects.filter(pk__in=drifted_ids).update(comments_count=actual)
+    return len(drifted_ids)
@@ -0,0 +1,304 @@
+"""
+Explore page search pipeline, shared by the ``explore`` page and the
+``fetch_more_anime`` infinite-scroll endpoint.
+
+Filters from the query string are normalised into Jikan params and the
+processed page (deduplicated, trimmed to the fields the cards render, with
+status colours attached) is cached per canonical filter set. Only the
+per-user watchlist/favorite flags are computed per request, from a single
+query scoped to the anime on the page.
+
+When a page with a successor is served, the successor is fetched in the
+background so infinite scroll usually finds it cached. At most
+``PREFETCH_LIMIT`` prefetches run at once; further ones are simply skipped
+so speculative traffic never crowds out real requests under Jikan's limits.
+
+Plain title searches (no other filters) are answered from the local
+``title_index`` when it has a strong match and at least a full page of
+catalog matches. Such a search is then paged locally throughout, so infinite
+scroll never mixes local and Jikan pages. Because the catalog is only filled
+as titles are visited, anything less goes to Jikan.
+
+``python manage.py benchmark_explore`` measures the per-page parse and
+decoration cost.
+"""
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from asgiref.sync import sync_to_async
+
+from application import jikan, title_index
+from application.catalog import status_color
+from application.jikan import JikanError
+from application.models import Anime, Watchlist
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = getattr(settings, 'EXPLORE_CACHE_ALIAS', 'default')
+PAGE_LIMIT = 24
+# Most catalog matches a locally answered search pages through
+LOCAL_RESULT_LIMIT = 10 * PAGE_LIMIT
+PREFETCH_LIMIT = getattr(settings, 'EXPLORE_PREFETCH_LIMIT', 2)
+
+# Prefetches run on their own threads so they outlive the request's event loop
+_prefetch_executor = ThreadPoolExecutor(max_workers=max(PREFETCH_LIMIT, 1), thread_name_prefix='explore-prefetch')
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+GENRE_MAPPING = {
+    "Action": 1, "Adventure": 2, "Comedy": 4, "Drama": 8,
+    "Fantasy": 10, "Romance": 22, "Sci-Fi": 24, "Thriller": 41
+}
+RATING_MAPPING = {
+    "5.0+": 5, "6.0+": 6, "7.0+": 7, "8.0+": 8, "9.0+": 9
+}
+STATUS_MAPPING = {
+    "completed": "complete", "upcoming": "upcoming", "ongoing": "airing"
+}
+SORT_MAPPING = {
+    'popularity': ('members', 'desc'),
+    'rating': ('score', 'desc'),
+    'year': ('start_date', 'desc'),
+    'title': ('title', 'asc'),
+}
+DEFAULT_SORT = 'popularity'
+FILTER_FIELDS = ['search', 'genre', 'year', 'rating', 'status', 'sort']
+
+
+def filters_from_query(query):
+    """Pull the explore filters out of a ``request.GET``-like mapping."""
+    return {field: query.get(field) or '' for field in FILTER_FIELDS}
+
+
+def parse_page(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def build_query(search='', genre='', year='', rating='', status='', sort=DEFAULT_SORT, page=1):
+    """
+    Map explore filters onto a Jikan ``(endpoint, params)`` pair.
+
+    Unknown filter values are dropped, so equivalent requests always produce
+    the same params. With no filters and the default sort the page comes from
+    ``top/anime``. Jikan is asked for exactly ``PAGE_LIMIT`` items so that
+    consecutive pages line up with what was rendered.
+    """
+    params = {'limit': PAGE_LIMIT}
+    if page > 1:
+        params['page'] = page
+    if search.strip():
+        params['q'] = search.strip()
+    if genre and genre.title() in GENRE_MAPPING:
+        params['genres'] = GENRE_MAPPING[genre.title()]
+    if year and year.isdigit():
+        params['start_date'] = f"{year}-01-01"
+        params['end_date'] = f"{year}-12-31"
+    if rating in RATING_MAPPING:
+        params['min_score'] = RATING_MAPPING[rating]
+    if status and status.lower() in STATUS_MAPPING:
+        params['status'] = STATUS_MAPPING[status.lower()]
+
+    params['sfw'] = 'true'
+    sort = sort if sort in SORT_MAPPING else DEFAULT_SORT
+    if params.keys() <= {'limit', 'page', 'sfw'} and sort == DEFAULT_SORT:
+        return 'top/anime', params
+    params['order_by'], params['sort'] = SORT_MAPPING[sort]
+    return 'anime', params
+
+
+def cache_key(endpoint, params):
+    canonical = json.dumps([endpoint, sorted((key, str(value)) for key, value in params.items())])
+    return f"explore:{hashlib.sha1(canonical.encode()).hexdigest()}"
+
+
+def card_fields(anime):
+    """Keep only what the explore cards render."""
+    return {
+        'mal_id': anime['mal_id'],
+        'title': anime.get('title') or '',
+        'title_english': anime.get('title_english') or '',
+        'images': {'webp': {'large_image_url': (anime.get('images') or {}).get('webp', {}).get('large_image_url')}},
+        'aired': {'prop': {'from': {'year': ((anime.get('aired') or {}).get('prop') or {}).get('from', {}).get('year')}}},
+        'year': anime.get('year'),
+        'score': anime.get('score'),
+        'episodes': anime.get('episodes'),
+        'status': anime.get('status') or 'unknown',
+        'status_color': status_color(anime.get('status')),
+    }
+
+
+def process_page(payload, limit=PAGE_LIMIT):
+    """Turn a Jikan listing payload into ``{'anime': [...], 'pagination': {...}}``."""
+    unique = {}
+    for anime in payload.get('data', []):
+        mal_id = anime.get('mal_id')
+        if mal_id and mal_id not in unique:
+            unique[mal_id] = card_fields(anime)
+    return {
+        'anime': list(unique.values())[:limit],
+        'pagination': payload.get('pagination', {}),
+    }
+
+
+def get_page(endpoint, params):
+    """Sync counterpart of ``aget_page``."""
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(endpoint, params)
+    page = cache.get(key)
+    if page is not None:
+        return page
+
+    try:
+        payload = jikan.get(endpoint, params=params)
+    except JikanError as exc:
+        logger.warning("Explore search failed for %s: %s", endpoint, exc)
+        return process_page({})
+    page = process_page(payload)
+    cache.set(key, page, timeout=jikan.ttl_for(endpoint))
+    return page
+
+
+async def aget_page(endpoint, params):
+    """
+    Return the processed page for ``endpoint``/``params``, from cache when possible.
+
+    Failed Jikan calls yield an empty page that is not cached.
+    """
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(endpoint, params)
+    page = await cache.aget(key)
+    if page is not None:
+        return page
+
+    try:
+        payload = await jikan.aget(endpoint, params=params)
+    except JikanError as exc:
+        logger.warning("Explore search failed for %s: %s", endpoint, exc)
+        return process_page({})
+    page = process_page(payload)
+    await cache.aset(key, page, timeout=jikan.ttl_for(endpoint))
+    return page
+
+
+def with_membership(anime_list, watchlist_ids, fav_ids):
+    """Copy cached cards, adding the viewer's watchlist/favorite flags."""
+    return [
+        {**anime, 'is_in_watchlist': anime['mal_id'] in watchlist_ids, 'is_favorite': anime['mal_id'] in fav_ids}
+        for anime in anime_list
+    ]
+
+
+def is_title_search(filters):
+    """True for a search term with no genre/year/rating/status filters."""
+    return bool(filters.get('search', '').strip()) and not any(
+        filters.get(field) for field in ('genre', 'year', 'rating', 'status')
+    )
+
+
+# sort key -> (card sort key, descending) for locally answered searches;
+# 'popularity' keeps the similarity order
+LOCAL_SORTS = {
+    'rating': (lambda card: card['score'] or 0, True),
+    'year': (lambda card: card['aired']['prop']['from']['year'] or card['year'] or 0, True),
+    'title': (lambda card: (card['title_english'] or card['title']).lower(), False),
+}
+
+
+def local_search(filters, page=1, limit=PAGE_LIMIT):
+    """
+    Answer ``page`` of a title search from the local catalog, or return None
+    when the catalog can't fill a first page with a strong best match.
+
+    The decision doesn't depend on ``page``, so every page of a search comes
+    from the same source.
+    """
+    matches = title_index.search(filters['search'], limit=LOCAL_RESULT_LIMIT)
+    if not matches or matches[0][1] < title_index.RESOLVE_THRESHOLD:
+        return None
+    rows = dict(Anime.objects.filter(mal_id__in=[mal_id for mal_id, similarity in matches]).values_list('mal_id', 'data'))
+    cards = [card_fields({**rows[mal_id], 'mal_id': mal_id}) for mal_id, similarity in matches if mal_id in rows]
+    if len(cards) < limit:
+        return None
+    if filters.get('sort') in LOCAL_SORTS:
+        key, descending = LOCAL_SORTS[filters['sort']]
+        cards.sort(key=key, reverse=descending)
+    return {
+        'anime': cards[(page - 1) * limit:page * limit],
+        'pagination': {
+            'has_next_page': len(cards) > page * limit,
+            'current_page': page,
+            'items': {'total': len(cards)},
+        },
+    }
+
+
+async def amembership(user, mal_ids):
+    """Return ``(watchlist_ids, favorite_ids)`` among ``mal_ids`` for ``user`` from one indexed query."""
+    watchlist_ids, fav_ids = set(), set()
+    entries = Watchlist.objects.filter(user=user, mal_id__in=mal_ids).values_list('mal_id', 'is_favorite')
+    async for mal_id, is_favorite in entries:
+        watchlist_ids.add(mal_id)
+        if is_favorite:
+            fav_ids.add(mal_id)
+    return watchlist_ids, fav_ids
+
+
+async def asearch(user, filters, page=1):
+    """
+    Run one explore search for ``user``.
+
+    Returns ``{'anime': [...], 'pagination': {...}, 'next_page': int | None}``
+    with each card carrying the user's watchlist/favorite flags.
+    """
+    result = None
+    if is_title_search(filters):
+        result = await sync_to_async(local_search)(filters, page)
+    local = result is not None
+    if not local:
+        endpoint, params = build_query(page=page, **filters)
+        result = await aget_page(endpoint, params)
+    watchlist_ids, fav_ids = await amembership(user, [anime['mal_id'] for anime in result['anime']])
+    has_next = result['pagination'].get('has_next_page', False)
+    if has_next and not local:
+        prefetch(filters, page + 1)
+    return {
+        'anime': with_membership(result['anime'], watchlist_ids, fav_ids),
+        'pagination': result['pagination'],
+        'next_page': page + 1 if has_next else None,
+    }
+
+
+def prefetch(filters, page):
+    """
+    Warm the cache with ``page`` of the ``filters`` search in the background.
+
+    Returns the ``Future`` for the fetch, or None when that page is already
+    being prefetched or ``PREFETCH_LIMIT`` prefetches are in flight.
+    """
+    endpoint, params = build_query(page=page, **filters)
+    key = cache_key(endpoint, params)
+    with _prefetch_lock:
+        if key in _prefetching or len(_prefetching) >= PREFETCH_LIMIT:
+            return None
+        _prefetching.add(key)
+
+    def run():
+        try:
+            get_page(endpoint, params)
+        finally:
+            with _prefetch_lock:
+                _prefetching.discard(key)
+            # The cache and the rate limiter may have opened a connection in this thread
+            connections.close_all()
+
+    return _prefetch_executor.submit(run)
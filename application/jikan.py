@@ -0,0 +1,417 @@
+"""
+Shared client for the Jikan (MyAnimeList) API.
+
+Every view talks to Jikan through this module instead of calling
+``requests.get`` directly. Responses are cached in two tiers:
+
+- a bounded in-process LRU (per worker, no serialization cost)
+- a shared Django cache (``JIKAN_CACHE_ALIAS``, the default cache unless
+  configured otherwise) so all workers benefit from each other's fetches
+
+Entries are *fresh* for a per-endpoint TTL and then *stale* for
+``JIKAN_STALE_TTL`` more seconds. A stale hit is returned immediately while
+a background thread revalidates it, so hot pages never wait on Jikan.
+
+Upstream calls are rate limited across processes (see ``ratelimit``) and
+coalesced:
+concurrent misses for the same URL make one request and share its result,
+within a process through a shared future and across processes through a
+short-lived lock in the shared cache.
+
+``aget`` uses a pooled ``httpx.AsyncClient`` per event loop when
+``JIKAN_ASYNC_HTTP`` is set, which is the default under ASGI. Under WSGI each
+async view runs on a fresh event loop that is thrown away afterwards, so
+there the request goes through the pooled ``requests`` session in a thread
+instead.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlencode
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from requests.adapters import HTTPAdapter
+
+from application.ratelimit import RateLimitExceeded, jikan_limiter
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = getattr(settings, 'JIKAN_BASE_URL', 'https://api.jikan.moe/v4/')
+TIMEOUT = getattr(settings, 'JIKAN_TIMEOUT', (3.05, 10))
+LRU_SIZE = getattr(settings, 'JIKAN_LRU_SIZE', 512)
+STALE_TTL = getattr(settings, 'JIKAN_STALE_TTL', 24 * 60 * 60)
+CACHE_ALIAS = getattr(settings, 'JIKAN_CACHE_ALIAS', 'default')
+# Longest a view request waits for a rate-limit slot before giving up
+RATE_LIMIT_WAIT = getattr(settings, 'JIKAN_RATE_LIMIT_WAIT', 5)
+# Longest a process waits for another process's in-flight request to land in the shared cache
+COALESCE_WAIT = getattr(settings, 'JIKAN_COALESCE_WAIT', 5)
+COALESCE_POLL = 0.05
+ASYNC_HTTP = getattr(settings, 'JIKAN_ASYNC_HTTP', False)
+
+# Fresh lifetime (seconds) per endpoint, first match wins
+ENDPOINT_TTLS = [
+    (re.compile(r'^top/anime$'), 60 * 60),
+    (re.compile(r'^anime/\d+/characters$'), 24 * 60 * 60),
+    (re.compile(r'^anime/\d+$'), 6 * 60 * 60),
+    (re.compile(r'^anime$'), 15 * 60),
+]
+DEFAULT_TTL = 10 * 60
+
+
+class JikanError(requests.RequestException):
+    """Raised when Jikan can't be reached or answers with a non-200 status."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def ttl_for(path):
+    for pattern, ttl in ENDPOINT_TTLS:
+        if pattern.match(path):
+            return ttl
+    return DEFAULT_TTL
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class JikanClient:
+    """
+    Caching Jikan client with a pooled HTTP session.
+
+    Cache entries are ``(body, fetched_at, ttl)`` tuples holding the raw
+    response text, so every caller gets its own freshly parsed payload and
+    can mutate it without poisoning the cache.
+    """
+
+    def __init__(self, base_url=BASE_URL, timeout=TIMEOUT, lru_size=LRU_SIZE,
+                 stale_ttl=STALE_TTL, cache_alias=CACHE_ALIAS, limiter=None,
+                 rate_limit_wait=RATE_LIMIT_WAIT, coalesce_wait=COALESCE_WAIT, async_http=ASYNC_HTTP):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.stale_ttl = stale_ttl
+        self.cache_alias = cache_alias
+        self.limiter = limiter or jikan_limiter()
+        self.rate_limit_wait = rate_limit_wait
+        self.coalesce_wait = coalesce_wait
+        self.async_http = async_http
+        self.local = LRUCache(lru_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    @staticmethod
+    def cache_key(path, params=None):
+        query = urlencode(sorted((params or {}).items()))
+        digest = hashlib.sha1(f"{path}?{query}".encode()).hexdigest()
+        return f"jikan:{digest}"
+
+    def get(self, path, params=None):
+        """
+        Return the parsed JSON for ``GET {base_url}{path}?params``.
+
+        Serves fresh and stale cache hits without touching the network
+        (stale ones are revalidated in the background). On a miss the
+        request is made synchronously; if it fails and an expired copy is
+        still cached, that copy is returned instead of raising.
+        """
+        path = path.strip('/')
+        key = self.cache_key(path, params)
+        entry = self._lookup(key)
+        if self._serve_cached(entry, key, path, params):
+            return self._parse(entry[0])
+
+        try:
+            body = self._fetch_and_store(key, path, params)
+        except JikanError:
+            if entry is None:
+                raise
+            logger.warning("Jikan unavailable, serving expired %s", path)
+            return self._parse(entry[0])
+        return self._parse(body)
+
+    async def aget(self, path, params=None):
+        """Async counterpart of ``get`` for async views."""
+        path = path.strip('/')
+        key = self.cache_key(path, params)
+        entry = await self._alookup(key)
+        if self._serve_cached(entry, key, path, params):
+            return self._parse(entry[0])
+
+        try:
+            body = await self._afetch_and_store(key, path, params)
+        except JikanError:
+            if entry is None:
+                raise
+            logger.warning("Jikan unavailable, serving expired %s", path)
+            return self._parse(entry[0])
+        return self._parse(body)
+
+    def fetch(self, path, params=None):
+        """
+        Fetch ``path`` straight from Jikan, bypassing (and not filling) the
+        cache. Waits as long as it takes for a rate-limit slot.
+        """
+        return self._parse(self._fetch(path.strip('/'), params, max_wait=None))
+
+    def invalidate(self, path, params=None):
+        key = self.cache_key(path.strip('/'), params)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def _serve_cached(self, entry, key, path, params):
+        """True if ``entry`` may be returned as-is; stale entries also get revalidated."""
+        if entry is None:
+            return False
+        body, fetched_at, ttl = entry
+        age = time.time() - fetched_at
+        if age < ttl:
+            return True
+        if age < ttl + self.stale_ttl:
+            self._revalidate_async(key, path, params)
+            return True
+        return False
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        return entry
+
+    async def _alookup(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.aget(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(key, entry, timeout=entry[2] + self.stale_ttl)
+
+    async def _astore(self, key, entry):
+        self.local.set(key, entry)
+        if self.shared is not None:
+            await self.shared.aset(key, entry, timeout=entry[2] + self.stale_ttl)
+
+    def _fetch(self, path, params, max_wait):
+        try:
+            self.limiter.acquire(max_wait)
+        except RateLimitExceeded as exc:
+            raise JikanError(f"Jikan rate limit reached for {path}: {exc}", 429) from exc
+        try:
+            response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise JikanError(f"Jikan request failed: {exc}") from exc
+        if response.status_code != 200:
+            raise JikanError(f"Jikan returned {response.status_code} for {path}", response.status_code)
+        return response.text
+
+    async def _afetch(self, path, params, max_wait):
+        try:
+            await self.limiter.aacquire(max_wait)
+        except RateLimitExceeded as exc:
+            raise JikanError(f"Jikan rate limit reached for {path}: {exc}", 429) from exc
+        try:
+            if self.async_http:
+                response = await self._async_client().get(self.base_url + path, params=params)
+            else:
+                response = await sync_to_async(self.session.get, thread_sensitive=False)(
+                    self.base_url + path, params=params, timeout=self.timeout
+                )
+        except (httpx.HTTPError, requests.RequestException) as exc:
+            raise JikanError(f"Jikan request failed: {exc}") from exc
+        if response.status_code != 200:
+            raise JikanError(f"Jikan returned {response.status_code} for {path}", response.status_code)
+        return response.text
+
+    def _async_client(self):
+        # httpx clients are bound to the event loop they were created on
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _fetch_and_store(self, key, path, params):
+        """Fetch and cache ``path``, sharing one upstream request among concurrent callers."""
+        future, leader = self._join_inflight(key)
+        if not leader:
+            return future.result()
+        try:
+            body = self._fetch_coalesced(key, path, params)
+        except BaseException as exc:
+            self._leave_inflight(key, future, error=exc, path=path)
+            raise
+        self._leave_inflight(key, future, body=body)
+        return body
+
+    async def _afetch_and_store(self, key, path, params):
+        future, leader = self._join_inflight(key)
+        if not leader:
+            # Shielded so a cancelled follower doesn't cancel the future the leader and others share
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            body = await self._afetch_coalesced(key, path, params)
+        except BaseException as exc:
+            self._leave_inflight(key, future, error=exc, path=path)
+            raise
+        self._leave_inflight(key, future, body=body)
+        return body
+
+    def _join_inflight(self, key):
+        """Return ``(future, leader)``; only the leader makes the request."""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _leave_inflight(self, key, future, body=None, error=None, path=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(body)
+        elif isinstance(error, JikanError):
+            future.set_exception(error)
+        else:
+            # Don't hand the leader's cancellation or crash to the waiters as their own
+            future.set_exception(JikanError(f"Shared request for {path} failed: {error!r}"))
+
+    def _fetch_coalesced(self, key, path, params):
+        """Leader side: when another process already holds the fetch lock, wait for its result."""
+        shared = self.shared
+        locked = shared is not None and shared.add(f"{key}:lock", 1, timeout=self.coalesce_wait)
+        if shared is not None and not locked:
+            deadline = time.monotonic() + self.coalesce_wait
+            while time.monotonic() < deadline:
+                time.sleep(COALESCE_POLL)
+                entry = shared.get(key)
+                if entry is not None and time.time() - entry[1] < entry[2]:
+                    self.local.set(key, entry)
+                    return entry[0]
+        try:
+            body = self._fetch(path, params, self.rate_limit_wait)
+            self._store(key, (body, time.time(), ttl_for(path)))
+            return body
+        finally:
+            if locked:
+                shared.delete(f"{key}:lock")
+
+    async def _afetch_coalesced(self, key, path, params):
+        shared = self.shared
+        locked = shared is not None and await shared.aadd(f"{key}:lock", 1, timeout=self.coalesce_wait)
+        if shared is not None and not locked:
+            deadline = time.monotonic() + self.coalesce_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(COALESCE_POLL)
+                entry = await shared.aget(key)
+                if entry is not None and time.time() - entry[1] < entry[2]:
+                    self.local.set(key, entry)
+                    return entry[0]
+        try:
+            body = await self._afetch(path, params, self.rate_limit_wait)
+            await self._astore(key, (body, time.time(), ttl_for(path)))
+            return body
+        finally:
+            if locked:
+                await shared.adelete(f"{key}:lock")
+
+    def _revalidate_async(self, key, path, params):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_and_store(key, path, params)
+            except JikanError as exc:
+                logger.warning("Background revalidation of %s failed: %s", path, exc)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+                connections.close_all()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @staticmethod
+    def _parse(body):
+        return json.loads(body)
+
+
+client = JikanClient()
+
+
+def get(path, params=None):
+    """Module-level shortcut for ``client.get``."""
+    return client.get(path, params)
+
+
+async def aget(path, params=None):
+    """Module-level shortcut for ``client.aget``."""
+    return await client.aget(path, params)
@@ -0,0 +1,193 @@
+"""
+Background jobs stored in the ``Job`` table and run by ``manage.py run_workers``.
+
+Handlers are registered by name with ``@task`` (see ``tasks.py``).
+``enqueue`` inserts the job in the caller's transaction, so work queued by a
+request only becomes visible to workers if that request commits. Workers
+claim due jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+supports it, retry failures with exponential backoff and give up after
+``max_attempts``. Enqueueing an ``idempotency_key`` that is already waiting
+in the queue is a no-op, which also debounces bursts of identical work.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from application.models import Job
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+# A running job whose worker hasn't finished it in this long is assumed lost
+LOCK_TIMEOUT = timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 10 * 60))
+KEEP_FINISHED = timedelta(days=getattr(settings, 'JOB_KEEP_FINISHED_DAYS', 7))
+BATCH_SIZE = 10
+# First retry waits about this many seconds, doubling with every attempt
+RETRY_BASE = 10
+RETRY_MAX = 60 * 60
+MAINTENANCE_INTERVAL = 60
+
+# name -> (handler, max_attempts)
+registry = {}
+
+
+def task(name=None, max_attempts=5):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def register(func):
+        registry[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, key=None, delay=0, **payload):
+    """
+    Queue the ``name`` task to run with ``payload`` as keyword arguments,
+    ``delay`` seconds from now. Returns the ``Job``, or None when a job with
+    the same ``key`` is already queued.
+    """
+    max_attempts = registry[name][1]
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                payload=payload,
+                idempotency_key=key,
+                max_attempts=max_attempts,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        return None
+
+
+def claim(worker_id, limit=BATCH_SIZE):
+    """Mark up to ``limit`` due jobs as running under ``worker_id`` and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_at__lte=now
+        ).order_by('run_at', 'id')
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status check keeps two workers from claiming the same row where
+        # SKIP LOCKED isn't available
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+        )
+    return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker_id).order_by('run_at', 'id'))
+
+
+def _requeue(job_ids, **fields):
+    """Put running jobs back in the queue, dropping any that a newer queued copy makes redundant."""
+    now = timezone.now()
+    for job_id in job_ids:
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job_id).update(
+                    status=Job.QUEUED, locked_by='', locked_at=None, updated_at=now, **fields
+                )
+        except IntegrityError:
+            Job.objects.filter(pk=job_id).delete()
+
+
+def release(jobs):
+    """Hand claimed but unstarted jobs back to the queue without counting an attempt."""
+    for job in jobs:
+        _requeue([job.pk], attempts=F('attempts') - 1)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times."""
+    delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+def run_job(job):
+    """Run one claimed job, recording success, a scheduled retry or a final failure. Returns True on success."""
+    try:
+        func = registry[job.name][0]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s failed after %s attempts:\n%s", job, job.attempts, error)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, locked_by='', locked_at=None, last_error=error, updated_at=now
+            )
+        else:
+            logger.warning("Job %s failed (attempt %s), retrying:\n%s", job, job.attempts, error)
+            _requeue([job.pk], run_at=now + timedelta(seconds=backoff(job.attempts)), last_error=error)
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_by='', locked_at=None, updated_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """Return jobs stuck in ``running`` past ``LOCK_TIMEOUT`` (their worker died) to the queue."""
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - LOCK_TIMEOUT)
+    job_ids = list(stale.values_list('id', flat=True))
+    _requeue(job_ids)
+    return len(job_ids)
+
+
+def prune():
+    """Delete finished jobs older than ``KEEP_FINISHED``; failed ones are kept for inspection."""
+    deleted, _ = Job.objects.filter(status=Job.DONE, updated_at__lt=timezone.now() - KEEP_FINISHED).delete()
+    return deleted
+
+
+def run_pending(worker_id='inline', limit=None):
+    """Run due jobs in this process until none are left (or ``limit`` have run). Returns the number run."""
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim(worker_id, BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - ran))
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job)
+            ran += 1
+    return ran
+
+
+class Worker:
+    """Polls the queue and runs jobs until ``stop()`` is called."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, batch_size=BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = threading.Event()
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def run(self):
+        last_maintenance = 0
+        while not self._stopping.is_set():
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                requeue_stale()
+                prune()
+                last_maintenance = time.monotonic()
+
+            jobs = claim(self.worker_id, self.batch_size)
+            for index, job in enumerate(jobs):
+                if self._stopping.is_set():
+                    release(jobs[index:])
+                    break
+                run_job(job)
+            close_old_connections()
+            if not jobs:
+                self._stopping.wait(self.poll_interval)
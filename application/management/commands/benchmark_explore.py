@@ -0,0 +1,108 @@
+import json
+import pickle
+import time
+
+from django.core.management.base import BaseCommand
+
+from application import explore_search, jikan
+from application.jikan import JikanError
+
+
+def sample_anime(mal_id):
+    """A Jikan ``/anime`` list item with the same shape and rough size as the real thing."""
+    return {
+        'mal_id': mal_id,
+        'url': f'https://myanimelist.net/anime/{mal_id}',
+        'images': {
+            fmt: {
+                'image_url': f'https://cdn.myanimelist.net/images/anime/{mal_id}.{fmt}',
+                'small_image_url': f'https://cdn.myanimelist.net/images/anime/{mal_id}t.{fmt}',
+                'large_image_url': f'https://cdn.myanimelist.net/images/anime/{mal_id}l.{fmt}',
+            }
+            for fmt in ('jpg', 'webp')
+        },
+        'trailer': {'youtube_id': 'x' * 11, 'url': 'https://www.youtube.com/watch?v=' + 'x' * 11, 'images': {}},
+        'approved': True,
+        'titles': [{'type': kind, 'title': f'Anime {mal_id} {kind}'} for kind in ('Default', 'Japanese', 'English')],
+        'title': f'Anime {mal_id}',
+        'title_english': f'Anime {mal_id} (English)',
+        'title_japanese': 'アニメ',
+        'type': 'TV',
+        'source': 'Manga',
+        'episodes': 24,
+        'status': 'Finished Airing' if mal_id % 3 else 'Currently Airing',
+        'airing': False,
+        'aired': {
+            'from': '2015-04-05T00:00:00+00:00', 'to': '2015-09-20T00:00:00+00:00',
+            'prop': {'from': {'day': 5, 'month': 4, 'year': 2015}, 'to': {'day': 20, 'month': 9, 'year': 2015}},
+            'string': 'Apr 5, 2015 to Sep 20, 2015',
+        },
+        'duration': '24 min per ep',
+        'rating': 'PG-13 - Teens 13 or older',
+        'score': 8.1,
+        'scored_by': 123456,
+        'rank': mal_id,
+        'popularity': mal_id,
+        'members': 1000000 - mal_id,
+        'favorites': 20000,
+        'synopsis': 'Lorem ipsum dolor sit amet. ' * 40,
+        'season': 'spring',
+        'year': 2015,
+        'studios': [{'mal_id': 1, 'type': 'anime', 'name': 'Studio', 'url': 'https://myanimelist.net/anime/producer/1'}],
+        'genres': [
+            {'mal_id': genre, 'type': 'anime', 'name': f'Genre {genre}', 'url': f'https://myanimelist.net/anime/genre/{genre}'}
+            for genre in (1, 2, 8)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-page cost of the explore pipeline: parsing a Jikan "
+        "listing, processing it into cached cards, and decorating those cards "
+        "with a user's watchlist flags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--live', action='store_true', help="Benchmark a real top/anime page instead of a synthetic one")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        payload = None
+        if options['live']:
+            endpoint, params = explore_search.build_query()
+            try:
+                payload = jikan.client.fetch(endpoint, params)
+            except JikanError as exc:
+                self.stderr.write(f"Could not fetch a live page ({exc}); using a synthetic one.")
+        if payload is None:
+            payload = {
+                'data': [sample_anime(mal_id) for mal_id in range(1, explore_search.PAGE_LIMIT + 1)],
+                'pagination': {'has_next_page': True, 'current_page': 1, 'items': {'total': 1000}},
+            }
+
+        body = json.dumps(payload)
+        page = explore_search.process_page(payload)
+        mal_ids = [anime['mal_id'] for anime in page['anime']]
+        # Half the page in the watchlist, a third of that favorited
+        watchlist_ids, fav_ids = set(mal_ids[::2]), set(mal_ids[::6])
+
+        timings = [
+            ('parse', lambda: json.loads(body)),
+            ('parse+process', lambda: explore_search.process_page(json.loads(body))),
+            ('cache trip', lambda: pickle.loads(pickle.dumps(page))),
+            ('decorate', lambda: explore_search.with_membership(page['anime'], watchlist_ids, fav_ids)),
+        ]
+        self.stdout.write(f"{len(page['anime'])} anime per page, {iterations} iterations")
+        for label, func in timings:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            per_page = (time.perf_counter() - started) / iterations * 1e6
+            self.stdout.write(f"  {label:<15}{per_page:10.1f} µs/page")
+
+        self.stdout.write(
+            f"  payload {len(body.encode()) / 1024:.1f} KiB raw, "
+            f"{len(pickle.dumps(page)) / 1024:.1f} KiB cached"
+        )
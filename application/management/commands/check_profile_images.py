@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from application.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every profile picture and cover image against MEDIA storage and "
+        "update the has_* flags the profile URL properties rely on."
+    )
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.filter(
+            Q(profile_picture__gt='') | Q(cover_image__gt='') |
+            Q(has_profile_picture=True) | Q(has_cover_image=True)
+        ).only('id', *UserProfile.IMAGE_FLAGS, *UserProfile.IMAGE_FLAGS.values())
+
+        changed = []
+        for profile in profiles.iterator(chunk_size=500):
+            dirty = False
+            for field, flag in UserProfile.IMAGE_FLAGS.items():
+                image = getattr(profile, field)
+                exists = bool(image) and image.storage.exists(image.name)
+                if getattr(profile, flag) != exists:
+                    setattr(profile, flag, exists)
+                    dirty = True
+            if dirty:
+                changed.append(profile)
+
+        UserProfile.objects.bulk_update(changed, list(UserProfile.IMAGE_FLAGS.values()), batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f"Updated image flags on {len(changed)} profile(s)."))
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from application.watchlist_import import ImportFormatError, import_watchlist
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a MyAnimeList XML (optionally gzipped) or AniList JSON export "
+        "into a user's watchlist without calling Jikan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help="Export file to import")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+
+        try:
+            with open(options['path'], 'rb') as export:
+                imported, skipped = import_watchlist(user, export)
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} anime, skipped {skipped} without a MyAnimeList id."))
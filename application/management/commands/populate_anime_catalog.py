@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from application import catalog
+from application.jikan import JikanError
+from application.models import Anime, Watchlist
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the local anime catalog from Jikan. Without ids, fetches every anime "
+        "referenced by a watchlist that is missing from (or stale in) the catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('mal_ids', nargs='*', type=int, help="MyAnimeList ids to fetch")
+        parser.add_argument('--characters', action='store_true', help="Also fetch character lists")
+        parser.add_argument('--force', action='store_true', help="Refetch even if the catalog copy is fresh")
+
+    def handle(self, *args, **options):
+        mal_ids = options['mal_ids'] or sorted(set(Watchlist.objects.values_list('mal_id', flat=True)))
+        if not options['force']:
+            fetched_at = dict(Anime.objects.filter(mal_id__in=mal_ids).values_list('mal_id', 'fetched_at'))
+            mal_ids = [mal_id for mal_id in mal_ids if catalog.is_stale(fetched_at.get(mal_id))]
+
+        failed = 0
+        for mal_id in mal_ids:
+            try:
+                anime = catalog.refresh_anime(mal_id, with_characters=options['characters'], characters_timeout=None)
+            except JikanError as exc:
+                failed += 1
+                self.stderr.write(f"{mal_id}: {exc}")
+                continue
+            self.stdout.write(f"{mal_id}: {anime.display_title}")
+
+        self.stdout.write(self.style.SUCCESS(f"Fetched {len(mal_ids) - failed} anime, {failed} failed."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from application.stats import rebuild_all_watchlist_stats, rebuild_watchlist_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized per-user watchlist stats from the Watchlist table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help="Only rebuild these users")
+
+    def handle(self, *args, **options):
+        if options['user_ids']:
+            for user_id in options['user_ids']:
+                rebuild_watchlist_stats(user_id)
+            count = len(options['user_ids'])
+        else:
+            count = rebuild_all_watchlist_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt watchlist stats for {count} user(s)."))
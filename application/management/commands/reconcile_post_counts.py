@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from application.counters import reconcile_post_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized per-post counters from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('post_ids', nargs='*', type=int, help="Only reconcile these posts")
+
+    def handle(self, *args, **options):
+        fixed = reconcile_post_counts(options['post_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Corrected {fixed} post(s)."))
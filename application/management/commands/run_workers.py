@@ -0,0 +1,59 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from application import jobs
+
+
+def run_worker(poll_interval):
+    # Spawned children start from a fresh interpreter; forked ones are already set up
+    import django
+    django.setup()
+    worker = jobs.Worker(poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the database queue: timeline fan-out, watchlist "
+        "enrichment from Jikan, counter reconciliation and notifications. Each "
+        "worker process finishes its current job on SIGTERM/SIGINT before exiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Worker processes to run")
+        parser.add_argument('--poll-interval', type=float, default=jobs.POLL_INTERVAL, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due now in this process, then exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            jobs.requeue_stale()
+            ran = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} job(s)."))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(options['poll_interval'],), name=f'jobs-worker-{number}')
+            for number in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} worker(s)")
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        # Workers get the same SIGINT from the terminal; SIGTERM is forwarded
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in processes:
+            process.join()
+        self.stdout.write("Workers stopped")
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from application import catalog, jikan
+from application.jikan import JikanError
+from application.models import CatalogSyncCheckpoint
+
+# Listing endpoints and the params giving each a stable page order
+ENDPOINTS = {
+    'anime': ('anime', {'order_by': 'mal_id', 'sort': 'asc'}),
+    'top': ('top/anime', {}),
+}
+PAGE_SIZE = 25
+
+
+class Command(BaseCommand):
+    help = (
+        "Walk Jikan's anime listings page by page and upsert them into the local "
+        "catalog, staying under the Jikan rate limit shared with the web workers. "
+        "Progress is checkpointed per endpoint, so an interrupted run resumes "
+        "where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['anime', 'top', 'all'], default='all')
+        parser.add_argument('--max-pages', type=int, default=None, help="Stop after this many pages per endpoint")
+        parser.add_argument('--workers', type=int, default=3, help="Pages fetched concurrently")
+        parser.add_argument('--retries', type=int, default=3, help="Retries per page on 429/5xx/network errors")
+        parser.add_argument('--restart', action='store_true', help="Ignore saved checkpoints and start from page 1")
+
+    def handle(self, *args, **options):
+        self.retries = options['retries']
+        sources = ['top', 'anime'] if options['source'] == 'all' else [options['source']]
+        for source in sources:
+            self.sync(source, options['workers'], options['max_pages'], options['restart'])
+
+    def fetch_page(self, endpoint, params, page):
+        for attempt in range(self.retries + 1):
+            try:
+                return jikan.client.fetch(endpoint, {**params, 'page': page, 'limit': PAGE_SIZE, 'sfw': 'true'})
+            except JikanError as exc:
+                retryable = exc.status_code is None or exc.status_code == 429 or exc.status_code >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def sync(self, source, workers, max_pages, restart):
+        endpoint, params = ENDPOINTS[source]
+        checkpoint, created = CatalogSyncCheckpoint.objects.get_or_create(endpoint=endpoint)
+        if restart:
+            checkpoint.page = 0
+        page = checkpoint.page + 1
+        last_page = page + max_pages - 1 if max_pages else None
+        self.stdout.write(f"Syncing {endpoint} from page {page}")
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while last_page is None or page <= last_page:
+                pages = range(page, page + workers if last_page is None else min(page + workers, last_page + 1))
+                try:
+                    results = list(pool.map(lambda p: self.fetch_page(endpoint, params, p), pages))
+                except JikanError as exc:
+                    raise CommandError(
+                        f"Stopped at {endpoint} page {page}: {exc}. Run again to resume from there."
+                    ) from exc
+
+                items = []
+                has_next = True
+                for current, payload in zip(pages, results):
+                    items.extend(payload.get('data', []))
+                    page = current + 1
+                    has_next = payload.get('pagination', {}).get('has_next_page', False)
+                    if not has_next:
+                        break
+
+                total += catalog.bulk_upsert(items)
+                # A finished walk resets to page 0 so the next run starts over
+                checkpoint.page = page - 1 if has_next else 0
+                checkpoint.save()
+                self.stdout.write(f"  {endpoint}: through page {page - 1} ({total} anime)")
+                if not has_next:
+                    break
+
+        self.stdout.write(self.style.SUCCESS(f"Upserted {total} anime from {endpoint}."))
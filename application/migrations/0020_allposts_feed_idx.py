@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0019_remove_allposts_avatar_url_alter_allposts_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='allposts',
+            index=models.Index(fields=['-created_at', '-id'], name='allposts_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0020_allposts_feed_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Anime',
+            fields=[
+                ('mal_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('title_english', models.CharField(blank=True, max_length=255)),
+                ('image_url', models.URLField(blank=True)),
+                ('status', models.CharField(blank=True, max_length=100)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('episodes', models.IntegerField(default=0)),
+                ('genres', models.JSONField(blank=True, default=list)),
+                ('synopsis', models.TextField(blank=True)),
+                ('trailer_url', models.URLField(blank=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('characters', models.JSONField(blank=True, default=list)),
+                ('fetched_at', models.DateTimeField()),
+                ('characters_fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_comments_count(apps, schema_editor):
+    AllPosts = apps.get_model('application', 'AllPosts')
+    Comment = apps.get_model('application', 'Comment')
+    counts = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(n=Count('pk')).values('n')
+    AllPosts.objects.update(comments_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0022_catalogsynccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allposts',
+            name='comments_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:16
+
+from django.db import migrations, models
+
+
+def flag_existing_images(apps, schema_editor):
+    # Assume stored files are present; check_profile_images verifies against storage
+    UserProfile = apps.get_model('application', 'UserProfile')
+    UserProfile.objects.exclude(profile_picture__isnull=True).exclude(profile_picture='').update(has_profile_picture=True)
+    UserProfile.objects.exclude(cover_image__isnull=True).exclude(cover_image='').update(has_cover_image=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0023_allposts_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='has_cover_image',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='has_profile_picture',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0030_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitWindow',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
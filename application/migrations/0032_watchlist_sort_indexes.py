@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:08
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0031_rate_limit_windows'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='watchlist',
+            name='watchlist_user_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='watchlist',
+            name='watchlist_user_rating_idx',
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(models.F('user'), django.db.models.functions.comparison.Coalesce('rating', django.db.models.expressions.RawSQL('-1.0', [], output_field=models.FloatField())), models.F('id'), name='watchlist_user_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', 'status', 'added_at', 'id'], name='watchlist_status_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', 'status', 'title', 'id'], name='watchlist_status_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(models.F('user'), models.F('status'), django.db.models.functions.comparison.Coalesce('rating', django.db.models.expressions.RawSQL('-1.0', [], output_field=models.FloatField())), models.F('id'), name='watchlist_status_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(condition=models.Q(('is_favorite', True)), fields=['user', 'added_at', 'id'], name='watchlist_fav_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(condition=models.Q(('is_favorite', True)), fields=['user', 'title', 'id'], name='watchlist_fav_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(models.F('user'), django.db.models.functions.comparison.Coalesce('rating', django.db.models.expressions.RawSQL('-1.0', [], output_field=models.FloatField())), models.F('id'), condition=models.Q(('is_favorite', True)), name='watchlist_fav_rating_idx'),
+        ),
+    ]
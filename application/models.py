@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.templatetags.static import static
-import os
+from django.utils import timezone
 # Create your models here.
 
 class AllPosts(models.Model):
@@ -10,12 +13,14 @@ class AllPosts(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     likes_count = models.PositiveBigIntegerField(default=0)
     share_count = models.PositiveBigIntegerField(default=0)
+    # Kept in sync by add_comment/delete_comment; see reconcile_post_counts
+    comments_count = models.PositiveBigIntegerField(default=0)
 
     @property
     def avatar_url(self):
         profile = getattr(self.user, "userprofile", None)
-        if profile and profile.profile_picture:
-            return profile.profile_picture.url
+        if profile:
+            return profile.profile_picture_url
         # Fallback to static default
         return static('images/profile_pics/img.png')
 
@@ -26,6 +31,10 @@ class AllPosts(models.Model):
         ordering = ['-created_at']
         verbose_name = "Post"
         verbose_name_plural = "Posts"
+        indexes = [
+            # Backs keyset pagination of the home feed
+            models.Index(fields=['-created_at', '-id'], name='allposts_feed_idx'),
+        ]
 
 
 # New Comment model
@@ -39,8 +48,8 @@ class Comment(models.Model):
     @property
     def avatar_url(self):
         profile = getattr(self.user, "userprofile", None)
-        if profile and profile.profile_picture:
-            return profile.profile_picture.url
+        if profile:
+            return profile.profile_picture_url
         # Fallback to static default
         return static('images/profile_pics/img.png')
 
@@ -59,6 +68,10 @@ class PostLike(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')  # Prevent duplicate likes
+        indexes = [
+            # Likes on a post since the last notification about them
+            models.Index(fields=['post', 'created_at'], name='postlike_post_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} likes {self.post}"
@@ -74,6 +87,45 @@ class CommentLike(models.Model):
         unique_together = ('user', 'comment')
 
 
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('follower', 'followee')
+
+    def __str__(self):
+        return f"{self.follower.username} follows {self.followee.username}"
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in one user's precomputed home timeline, written by fan-out when
+    the post is created (see ``application.timeline``).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(AllPosts, on_delete=models.CASCADE, related_name='+')
+    # Copied from the post so a timeline page is a range scan on one index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_page_idx'),
+        ]
+
+
+def rating_sort_key():
+    """
+    Sort key for the watchlist rating order: unrated entries (NULL) rank
+    below every 0-10 rating, so they come last when sorting descending.
+    The rating indexes are built on the same expression; the constant is
+    inlined rather than a query parameter so the planner can match them.
+    """
+    return Coalesce('rating', RawSQL('-1.0', [], output_field=FloatField()))
+
+
 class Watchlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     mal_id = models.IntegerField()
@@ -87,6 +139,21 @@ class Watchlist(models.Model):
 
     class Meta:
         unique_together = ('user', 'mal_id')  # Prevent duplicates
+        indexes = [
+            # Keyset pagination for each watchlist sort order, over the whole
+            # list, one status (these also serve per-status counts) or favorites
+            models.Index(fields=['user', 'added_at', 'id'], name='watchlist_user_added_idx'),
+            models.Index(fields=['user', 'title', 'id'], name='watchlist_user_title_idx'),
+            models.Index(F('user'), rating_sort_key(), F('id'), name='watchlist_user_rating_idx'),
+            models.Index(fields=['user', 'status', 'added_at', 'id'], name='watchlist_status_added_idx'),
+            models.Index(fields=['user', 'status', 'title', 'id'], name='watchlist_status_title_idx'),
+            models.Index(F('user'), F('status'), rating_sort_key(), F('id'), name='watchlist_status_rating_idx'),
+            models.Index(fields=['user', 'added_at', 'id'], condition=Q(is_favorite=True), name='watchlist_fav_added_idx'),
+            models.Index(fields=['user', 'title', 'id'], condition=Q(is_favorite=True), name='watchlist_fav_title_idx'),
+            models.Index(
+                F('user'), rating_sort_key(), F('id'), condition=Q(is_favorite=True), name='watchlist_fav_rating_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.user.username}"
@@ -98,15 +165,182 @@ class UserProfile(models.Model):
     bio = models.TextField(blank=True)
     location = models.TextField(blank=True)
     show_email = models.BooleanField(default=False)
+    # Whether the stored file is known to exist; set on upload/removal and
+    # re-checked by the check_profile_images command
+    has_profile_picture = models.BooleanField(default=False)
+    has_cover_image = models.BooleanField(default=False)
+    # Kept in sync by the follow toggle; decides fan-out on write vs on read
+    followers_count = models.PositiveIntegerField(default=0)
+    # Unread Notification rows, kept in sync by notifications.py
+    unread_notifications = models.PositiveIntegerField(default=0)
+
+    IMAGE_FLAGS = {'profile_picture': 'has_profile_picture', 'cover_image': 'has_cover_image'}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        for field, flag in self.IMAGE_FLAGS.items():
+            image = getattr(self, field)
+            if not image:
+                setattr(self, flag, False)
+            elif not image._committed:
+                # A fresh upload, written to storage as part of this save
+                setattr(self, flag, True)
+            if update_fields is not None and field in update_fields:
+                kwargs['update_fields'] = update_fields = {*update_fields, flag}
+        super().save(*args, **kwargs)
 
     @property
     def profile_picture_url(self):
-        if self.profile_picture and os.path.exists(self.profile_picture.path):
+        if self.profile_picture and self.has_profile_picture:
             return self.profile_picture.url
         return static('images/profile_pics/img.png')
 
     @property
     def cover_image_url(self):
-        if self.cover_image and os.path.exists(self.cover_image.path):
+        if self.cover_image and self.has_cover_image:
             return self.cover_image.url
-        return static('images/cover_pics/cover_page.jpg')
\ No newline at end of file
+        return static('images/cover_pics/cover_page.jpg')
+
+
+class Anime(models.Model):
+    """Local mirror of a Jikan anime record, keyed by its MyAnimeList id."""
+    mal_id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    title_english = models.CharField(max_length=255, blank=True)
+    image_url = models.URLField(blank=True)
+    status = models.CharField(max_length=100, blank=True)
+    score = models.FloatField(blank=True, null=True)
+    episodes = models.IntegerField(default=0)
+    genres = models.JSONField(default=list, blank=True)
+    synopsis = models.TextField(blank=True)
+    trailer_url = models.URLField(blank=True)
+    # Full Jikan payload, rendered as-is by anime_details.html
+    data = models.JSONField(default=dict, blank=True)
+    characters = models.JSONField(default=list, blank=True)
+    fetched_at = models.DateTimeField()
+    characters_fetched_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def display_title(self):
+        return self.title_english or self.title
+
+    def __str__(self):
+        return f"{self.display_title} ({self.mal_id})"
+
+
+class CatalogSyncCheckpoint(models.Model):
+    """Last Jikan listing page fully imported by ``sync_anime_catalog``, per endpoint."""
+    endpoint = models.CharField(max_length=50, unique=True)
+    page = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.endpoint} @ page {self.page}"
+
+
+class RateLimitWindow(models.Model):
+    """Outbound requests counted in one fixed rate-limit window (see ratelimit.DatabaseRateLimiter)."""
+    key = models.CharField(max_length=100, primary_key=True)
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+
+class WatchlistStats(models.Model):
+    """Per-user watchlist counters, kept up to date on every watchlist write (see stats.py)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    watching = models.PositiveIntegerField(default=0)
+    plan_to_watch = models.PositiveIntegerField(default=0)
+    dropped = models.PositiveIntegerField(default=0)
+    favorites = models.PositiveIntegerField(default=0)
+    # Episodes across completed entries
+    total_episodes = models.PositiveIntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    rated_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def mean_rating(self):
+        return self.rating_sum / self.rated_count if self.rated_count else None
+
+    def __str__(self):
+        return f"Watchlist stats for {self.user.username}"
+
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_workers`` (see jobs.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing a key that is already queued is a no-op
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['idempotency_key'], condition=models.Q(status='queued'), name='job_queued_key_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class Notification(models.Model):
+    """
+    Activity on a user's posts or profile. Events of one kind on one target
+    are coalesced into a single unread row ("12 people liked your post")
+    until the recipient reads it (see notifications.py).
+    """
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    VERB_CHOICES = [(LIKE, 'Like'), (COMMENT, 'Comment'), (FOLLOW, 'Follow')]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    # None for follows, which are about the recipient themselves
+    post = models.ForeignKey(AllPosts, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Most recent of the actor_count users behind this notification
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    actor_count = models.PositiveIntegerField(default=1)
+    # Events after ``since`` (up to ``last_event_at``) are counted in this row
+    since = models.DateTimeField(null=True, blank=True)
+    last_event_at = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at'], name='notification_recipient_idx'),
+            models.Index(fields=['recipient', 'verb', 'post', '-created_at'], name='notification_target_idx'),
+        ]
+
+    @property
+    def others_count(self):
+        return self.actor_count - 1
+
+    def __str__(self):
+        return f"{self.verb} x{self.actor_count} for {self.recipient.username}"
@@ -0,0 +1,125 @@
+"""
+Coalesced notifications for likes, comments and follows.
+
+A like, comment or follow only queues a delivery job for its target (a post,
+or the followed user). The job is keyed on the target and delayed by
+``DELIVERY_DELAY``, so a burst of events collapses into one job. That job
+folds every event since the last notification into a single row: it updates
+the row while it is still unread, or starts a new one after the recipient
+has read it. A viral post therefore writes one notification per read
+instead of one per like.
+
+``UserProfile.unread_notifications`` mirrors the number of unread rows, so
+the navbar badge is polled with a single lookup by user id.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+
+from application import jobs
+from application.models import AllPosts, Comment, Follow, Notification, PostLike, UserProfile
+
+# Seconds events on one target are collected before they are delivered
+DELIVERY_DELAY = getattr(settings, 'NOTIFICATION_DELIVERY_DELAY', 30)
+PAGE_SIZE = 30
+
+# verb -> (event model, target field, actor field)
+SOURCES = {
+    Notification.LIKE: (PostLike, 'post', 'user'),
+    Notification.COMMENT: (Comment, 'post', 'user'),
+    Notification.FOLLOW: (Follow, 'followee', 'follower'),
+}
+
+
+def schedule(verb, target_id):
+    """Queue delivery of ``verb`` events on ``target_id`` (a post id, or a user id for follows)."""
+    jobs.enqueue(
+        'deliver_notifications', key=f'deliver_notifications:{verb}:{target_id}', delay=DELIVERY_DELAY,
+        verb=verb, target_id=target_id,
+    )
+
+
+def _adjust_unread(user_id, delta):
+    if delta > 0:
+        UserProfile.objects.get_or_create(user_id=user_id)
+        UserProfile.objects.filter(user_id=user_id).update(unread_notifications=F('unread_notifications') + delta)
+    elif delta < 0:
+        UserProfile.objects.filter(user_id=user_id).update(
+            unread_notifications=Greatest(F('unread_notifications') + delta, 0)
+        )
+
+
+def deliver(verb, target_id):
+    """
+    Fold the ``verb`` events on ``target_id`` that no notification covers yet
+    into the recipient's unread notification for that target, creating it if
+    needed. Recomputes the row from the event table, so running it twice is
+    harmless. Returns the notification, or None if there is nothing to report.
+    """
+    model, target_field, actor_field = SOURCES[verb]
+    if verb == Notification.FOLLOW:
+        recipient_id, post_id = target_id, None
+    else:
+        recipient_id = AllPosts.objects.filter(pk=target_id).values_list('user_id', flat=True).first()
+        post_id = target_id
+        if recipient_id is None:
+            return None
+
+    with transaction.atomic():
+        latest = Notification.objects.select_for_update().filter(
+            recipient_id=recipient_id, verb=verb, post_id=post_id
+        ).order_by('-created_at', '-id').first()
+        unread = latest if latest is not None and not latest.is_read else None
+        if unread is not None:
+            since = unread.since
+        else:
+            since = latest.last_event_at if latest is not None else None
+
+        events = model.objects.filter(**{f'{target_field}_id': target_id}).exclude(**{f'{actor_field}_id': recipient_id})
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        summary = events.aggregate(actor_count=Count(actor_field, distinct=True), last_event_at=Max('created_at'))
+
+        if not summary['actor_count']:
+            # Everything it reported was undone (unliked, deleted, unfollowed)
+            if unread is not None:
+                unread.delete()
+                _adjust_unread(recipient_id, -1)
+            return None
+
+        actor_id = events.order_by('-created_at').values_list(f'{actor_field}_id', flat=True).first()
+        if unread is not None:
+            unread.actor_id = actor_id
+            unread.actor_count = summary['actor_count']
+            unread.last_event_at = summary['last_event_at']
+            unread.save(update_fields=['actor', 'actor_count', 'last_event_at', 'updated_at'])
+            return unread
+
+        notification = Notification.objects.create(
+            recipient_id=recipient_id,
+            verb=verb,
+            post_id=post_id,
+            actor_id=actor_id,
+            actor_count=summary['actor_count'],
+            since=since,
+            last_event_at=summary['last_event_at'],
+        )
+        _adjust_unread(recipient_id, 1)
+    return notification
+
+
+def unread_count(user):
+    return UserProfile.objects.filter(user=user).values_list('unread_notifications', flat=True).first() or 0
+
+
+def recent(user, limit=PAGE_SIZE):
+    return list(
+        Notification.objects.filter(recipient=user).select_related('actor', 'post').order_by('-updated_at')[:limit]
+    )
+
+
+def mark_all_read(user):
+    with transaction.atomic():
+        Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+        UserProfile.objects.filter(user=user).update(unread_notifications=0)
@@ -0,0 +1,240 @@
+"""
+Rate limiting for outbound Jikan requests.
+
+Jikan allows roughly 3 requests per second and 60 per minute, so the
+default limiters combine one window for each. ``RateLimiter`` keeps its
+token buckets in process memory. ``SharedRateLimiter`` counts requests in a
+Django cache and ``DatabaseRateLimiter`` in the ``RateLimitWindow`` table, so
+every worker process draws from the same budget.
+"""
+import asyncio
+import threading
+import time
+from contextlib import suppress
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from application.models import RateLimitWindow
+
+# (requests, per seconds) windows that must all have capacity
+JIKAN_RATE_LIMITS = getattr(settings, 'JIKAN_RATE_LIMITS', [(3, 1), (60, 60)])
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to wait longer than the caller allows."""
+
+    def __init__(self, wait):
+        super().__init__(f"Rate limited for another {wait:.2f}s")
+        self.wait = wait
+
+
+class TokenBucket:
+    """Thread-safe bucket holding up to ``rate`` tokens, refilled evenly over ``per`` seconds."""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds until one will be."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.fill_rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Blocks until every configured window has room for one more request."""
+
+    def __init__(self, limits=None):
+        self.buckets = [TokenBucket(rate, per) for rate, per in (limits or JIKAN_RATE_LIMITS)]
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Take a token from every bucket if all have one; otherwise take none and
+        return seconds until they will.
+        """
+        with self._lock:
+            for bucket in self.buckets:
+                bucket._lock.acquire()
+            try:
+                wait = 0
+                for bucket in self.buckets:
+                    bucket._refill()
+                    if bucket.tokens < 1:
+                        wait = max(wait, (1 - bucket.tokens) / bucket.fill_rate)
+                if not wait:
+                    for bucket in self.buckets:
+                        bucket.tokens -= 1
+                return wait
+            finally:
+                for bucket in self.buckets:
+                    bucket._lock.release()
+
+    async def atry_acquire(self):
+        return self.try_acquire()
+
+    def acquire(self, max_wait=None):
+        """Block until a request may be made; raise ``RateLimitExceeded`` if that is beyond ``max_wait`` seconds."""
+        _wait_for_slot(self.try_acquire, max_wait)
+
+    async def aacquire(self, max_wait=None):
+        await _await_slot(self.atry_acquire, max_wait)
+
+
+class FixedWindowLimiter:
+    """Base for limiters that count requests per fixed window in storage shared by all processes."""
+
+    def __init__(self, limits=None, prefix='ratelimit:jikan'):
+        self.limits = limits or JIKAN_RATE_LIMITS
+        self.prefix = prefix
+
+    def windows(self):
+        now = time.time()
+        for rate, per in self.limits:
+            window = int(now // per)
+            yield f"{self.prefix}:{per}:{window}", rate, per, (window + 1) * per - now
+
+    def acquire(self, max_wait=None):
+        _wait_for_slot(self.try_acquire, max_wait)
+
+    async def aacquire(self, max_wait=None):
+        await _await_slot(self.atry_acquire, max_wait)
+
+
+class SharedRateLimiter(FixedWindowLimiter):
+    """
+    Fixed-window limiter whose counters live in a Django cache, so it holds
+    across worker processes and hosts. Needs a cache with atomic ``incr``
+    (Redis or memcached; the database cache's ``incr`` is a read then a write).
+    """
+
+    def __init__(self, cache_alias, limits=None, prefix='ratelimit:jikan'):
+        super().__init__(limits, prefix)
+        self.cache_alias = cache_alias
+
+    def try_acquire(self):
+        """Count one request in every window, or undo the counts and return seconds until the full one resets."""
+        cache = caches[self.cache_alias]
+        counted = []
+        for key, rate, per, remaining in self.windows():
+            cache.add(key, 0, timeout=per + 1)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # Expired between add() and incr(); that window is over anyway
+                continue
+            counted.append(key)
+            if count > rate:
+                for key in counted:
+                    with suppress(ValueError):
+                        cache.decr(key)
+                return remaining
+        return 0
+
+    async def atry_acquire(self):
+        cache = caches[self.cache_alias]
+        counted = []
+        for key, rate, per, remaining in self.windows():
+            await cache.aadd(key, 0, timeout=per + 1)
+            try:
+                count = await cache.aincr(key)
+            except ValueError:
+                continue
+            counted.append(key)
+            if count > rate:
+                for key in counted:
+                    with suppress(ValueError):
+                        await cache.adecr(key)
+                return remaining
+        return 0
+
+
+class DatabaseRateLimiter(FixedWindowLimiter):
+    """
+    Fixed-window limiter counting in the ``RateLimitWindow`` table, shared by
+    every process using the database with no cache server needed. Each
+    window's row is incremented with an ``F()`` update inside one
+    transaction, so concurrent requests queue on the row lock instead of
+    overcounting, and a refused request rolls its increments back.
+    """
+
+    def try_acquire(self):
+        with transaction.atomic():
+            for key, rate, per, remaining in self.windows():
+                expires_at = timezone.now() + timedelta(seconds=remaining)
+                RateLimitWindow.objects.bulk_create(
+                    [RateLimitWindow(key=key, expires_at=expires_at)], ignore_conflicts=True
+                )
+                RateLimitWindow.objects.filter(pk=key).update(count=F('count') + 1)
+                count = RateLimitWindow.objects.filter(pk=key).values_list('count', flat=True).get()
+                if count > rate:
+                    transaction.set_rollback(True)
+                    return remaining
+                if count == 1:
+                    # First request of a new window; clear out finished ones
+                    RateLimitWindow.objects.filter(
+                        key__startswith=f"{self.prefix}:", expires_at__lt=timezone.now()
+                    ).delete()
+        return 0
+
+    async def atry_acquire(self):
+        return await sync_to_async(self.try_acquire)()
+
+
+def _wait_for_slot(try_acquire, max_wait):
+    waited = 0
+    while True:
+        wait = try_acquire()
+        if not wait:
+            return
+        if max_wait is not None and waited + wait > max_wait:
+            raise RateLimitExceeded(wait)
+        time.sleep(wait)
+        waited += wait
+
+
+async def _await_slot(atry_acquire, max_wait):
+    waited = 0
+    while True:
+        wait = await atry_acquire()
+        if not wait:
+            return
+        if max_wait is not None and waited + wait > max_wait:
+            raise RateLimitExceeded(wait)
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+def jikan_limiter():
+    """
+    The limiter Jikan calls share: cache-backed when
+    ``JIKAN_RATE_LIMIT_CACHE_ALIAS`` is set, otherwise counted in the database.
+    """
+    alias = getattr(settings, 'JIKAN_RATE_LIMIT_CACHE_ALIAS', None)
+    return SharedRateLimiter(alias) if alias else DatabaseRateLimiter()
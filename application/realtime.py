@@ -0,0 +1,204 @@
+"""
+Live like/comment counts pushed to open pages over Server-Sent Events.
+
+Each page opens one ``EventSource`` for the posts it shows
+(``views.post_events``). The connection subscribes to those posts on the
+process-wide broadcaster and receives a small ``counts`` event whenever one
+of them changes, so other viewers' numbers stay current without reloading.
+Events carry the new totals, not increments, so a missed event can never
+leave a counter wrong.
+
+The broadcaster class is set by ``REALTIME_BACKEND``:
+
+``LocalBroadcaster``
+    Delivers what this process publishes, straight away. Enough when a
+    single worker serves every connection.
+``PollingBroadcaster`` (default)
+    Adds one query every ``REALTIME_POLL_INTERVAL`` seconds for all posts
+    watched in this process. It picks up changes made by other workers,
+    with no broker to run.
+
+Streams need the ASGI server (``SERVER_MODE=asgi``). Under WSGI each open
+stream would hold a worker thread, so the endpoint answers 204 unless
+``REALTIME_ENABLED`` is set. ``EventSource`` takes that as "don't reconnect".
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from application.models import AllPosts
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'REALTIME_ENABLED', False)
+POLL_INTERVAL = getattr(settings, 'REALTIME_POLL_INTERVAL', 3.0)
+# Posts one connection may watch
+MAX_POSTS = 100
+# Comment sent on idle streams so proxies don't close them
+KEEPALIVE = 15
+# Changes within this window go out as one batch
+BATCH_INTERVAL = 0.25
+RETRY_MS = 5000
+
+
+def counts_event(post_id, likes, comments):
+    return {'post': post_id, 'likes': likes, 'comments': comments}
+
+
+class Subscription:
+    """One stream's view of the broadcaster: the latest unsent event per post."""
+
+    def __init__(self, post_ids):
+        self.post_ids = frozenset(post_ids)
+        self.loop = asyncio.get_running_loop()
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def put(self, event):
+        """Queue ``event`` from any thread; a newer event for the same post replaces it."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        self._pending[event['post']] = event
+        self._ready.set()
+
+    async def get(self, timeout):
+        """Return the pending events, or an empty list after ``timeout`` seconds without any."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        events, self._pending = list(self._pending.values()), {}
+        return events
+
+
+class LocalBroadcaster:
+    """Delivers published events to the streams open in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, post_ids):
+        subscription = Subscription(post_ids)
+        with self._lock:
+            for post_id in subscription.post_ids:
+                self._subscribers[post_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for post_id in subscription.post_ids:
+                subscribers = self._subscribers.get(post_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[post_id]
+
+    def watched(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def seen(self, event):
+        """Note counts a stream has already sent; only pollers need them."""
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['post'], ()))
+        for subscription in subscribers:
+            try:
+                subscription.put(event)
+            except RuntimeError:
+                # Its event loop has closed; the stream is gone
+                self.unsubscribe(subscription)
+
+
+class PollingBroadcaster(LocalBroadcaster):
+    """``LocalBroadcaster`` that also polls the watched posts' counters to see other workers' writes."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self._known = {}
+        self._poller = None
+
+    def subscribe(self, post_ids):
+        subscription = super().subscribe(post_ids)
+        loop = asyncio.get_running_loop()
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not loop:
+            self._poller = loop.create_task(self._poll())
+        return subscription
+
+    def seen(self, event):
+        self._known.setdefault(event['post'], (event['likes'], event['comments']))
+
+    def publish(self, event):
+        self._known[event['post']] = (event['likes'], event['comments'])
+        super().publish(event)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            watched = self.watched()
+            if not watched:
+                self._known.clear()
+                return
+            try:
+                rows = AllPosts.objects.filter(pk__in=watched).values_list('id', 'likes_count', 'comments_count')
+                async for post_id, likes, comments in rows:
+                    if post_id in self._known and self._known[post_id] != (likes, comments):
+                        super().publish(counts_event(post_id, likes, comments))
+                    self._known[post_id] = (likes, comments)
+            except Exception:
+                logger.exception("Polling post counters failed")
+            for post_id in set(self._known) - watched:
+                del self._known[post_id]
+
+
+broadcaster = import_string(getattr(settings, 'REALTIME_BACKEND', 'application.realtime.PollingBroadcaster'))()
+
+
+def publish_post_counts(post_id):
+    """Send ``post_id``'s current like and comment totals to everyone watching it."""
+    if not ENABLED:
+        # Nobody can be watching, so skip the query
+        return
+    counts = AllPosts.objects.filter(pk=post_id).values_list('likes_count', 'comments_count').first()
+    if counts is not None:
+        broadcaster.publish(counts_event(post_id, *counts))
+
+
+def _format(event):
+    return f"event: counts\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(post_ids):
+    """
+    Server-Sent Events for ``post_ids``: the current totals first, then every
+    change until the client disconnects.
+    """
+    subscription = broadcaster.subscribe(post_ids)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        # Pages are often served from the back/forward cache, so start from fresh numbers
+        rows = AllPosts.objects.filter(pk__in=post_ids).values_list('id', 'likes_count', 'comments_count')
+        async for post_id, likes, comments in rows:
+            event = counts_event(post_id, likes, comments)
+            broadcaster.seen(event)
+            yield _format(event)
+        while True:
+            events = await subscription.get(KEEPALIVE)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield _format(event)
+            await asyncio.sleep(BATCH_INTERVAL)
+    finally:
+        broadcaster.unsubscribe(subscription)
@@ -0,0 +1,125 @@
+"""
+Per-user watchlist statistics shown on the profile page.
+
+``WatchlistStats`` holds one materialized row per user. Every view that
+writes a ``Watchlist`` row reports the change through
+``record_watchlist_change`` in the same transaction, which shifts the
+counters with ``F()`` expressions. ``watchlist_stats`` recomputes the same
+numbers from scratch and is used to (re)build a row.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from application.models import Watchlist, WatchlistStats
+
+# Watchlist.status values counted individually on the profile page
+TRACKED_STATUSES = ['completed', 'watching', 'plan_to_watch', 'dropped']
+
+
+def _aggregates():
+    aggregates = {
+        'total': Count('pk'),
+        'favorites': Count('pk', filter=Q(is_favorite=True)),
+        'total_episodes': Sum('total_episodes', filter=Q(status='completed')),
+        'rating_sum': Sum('rating'),
+        'rated_count': Count('rating'),
+    }
+    for status in TRACKED_STATUSES:
+        aggregates[status] = Count('pk', filter=Q(status=status))
+    return aggregates
+
+
+def _fill_nulls(stats):
+    stats['total_episodes'] = stats['total_episodes'] or 0
+    stats['rating_sum'] = stats['rating_sum'] or 0
+    return stats
+
+
+def watchlist_stats(user):
+    """
+    Return counts for ``user``'s watchlist in a single aggregate query:
+    ``total``, one key per status in ``TRACKED_STATUSES``, ``favorites``,
+    ``total_episodes`` (episodes across completed entries), and
+    ``rating_sum``/``rated_count`` for the mean rating.
+    """
+    return _fill_nulls(Watchlist.objects.filter(user=user).aggregate(**_aggregates()))
+
+
+def rebuild_watchlist_stats(user_id):
+    """Recompute and store the ``WatchlistStats`` row for one user."""
+    values = watchlist_stats(user_id)
+    try:
+        with transaction.atomic():
+            stats, created = WatchlistStats.objects.update_or_create(user_id=user_id, defaults=values)
+    except IntegrityError:
+        # Another request created the row first; overwrite it with our totals
+        stats, created = WatchlistStats.objects.update_or_create(user_id=user_id, defaults=values)
+    return stats
+
+
+def rebuild_all_watchlist_stats(batch_size=500):
+    """Rebuild every user's row with one grouped query. Returns the number of rows written."""
+    rows = [
+        WatchlistStats(user_id=values.pop('user'), **_fill_nulls(values))
+        for values in Watchlist.objects.order_by().values('user').annotate(**_aggregates())
+    ]
+    with transaction.atomic():
+        WatchlistStats.objects.exclude(user_id__in=[row.user_id for row in rows]).delete()
+        WatchlistStats.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['total', 'favorites', 'total_episodes', 'rating_sum', 'rated_count', *TRACKED_STATUSES],
+        )
+    return len(rows)
+
+
+def get_watchlist_stats(user):
+    """Return the ``WatchlistStats`` row for ``user``, building it on first access."""
+    stats = WatchlistStats.objects.filter(user=user).first()
+    return stats if stats is not None else rebuild_watchlist_stats(user.pk)
+
+
+def _contribution(entry):
+    """What one watchlist entry adds to its owner's counters."""
+    if entry is None:
+        return {}
+    contribution = {'total': 1}
+    if entry.status in TRACKED_STATUSES:
+        contribution[entry.status] = 1
+    if entry.is_favorite:
+        contribution['favorites'] = 1
+    if entry.status == 'completed' and entry.total_episodes:
+        contribution['total_episodes'] = int(entry.total_episodes)
+    if entry.rating not in (None, ''):
+        contribution['rating_sum'] = float(entry.rating)
+        contribution['rated_count'] = 1
+    return contribution
+
+
+def record_watchlist_change(user_id, before, after):
+    """
+    Apply the difference between two states of a watchlist entry (``None``
+    for "didn't exist") to the user's stats row. Call it inside the same
+    transaction as the write, after the write.
+    """
+    old, new = _contribution(before), _contribution(after)
+    delta = {field: new.get(field, 0) - old.get(field, 0) for field in old.keys() | new.keys()}
+    delta = {field: change for field, change in delta.items() if change}
+    if not delta:
+        return
+    updated = WatchlistStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + change for field, change in delta.items()}
+    )
+    if not updated:
+        # No row yet: build it from the table, which already includes this write
+        rebuild_watchlist_stats(user_id)
+
+
+def create_watchlist_entry(**fields):
+    """Create a watchlist entry and count it in its owner's stats."""
+    with transaction.atomic():
+        entry = Watchlist.objects.create(**fields)
+        record_watchlist_change(entry.user_id, None, entry)
+    return entry
@@ -0,0 +1,63 @@
+"""
+Background job handlers, run by ``manage.py run_workers`` (see jobs.py).
+
+Imported by ``ApplicationConfig.ready`` so every process can enqueue and run
+them by name.
+"""
+from copy import copy
+
+from django.db import transaction
+
+from application import catalog, counters, jobs, notifications, stats, timeline
+from application.models import Anime, Watchlist
+
+
+@jobs.task()
+def fanout_post(post_id):
+    timeline.fanout_post(post_id)
+
+
+@jobs.task()
+def enrich_watchlist_entry(user_id, mal_id, submitted=None):
+    """
+    Refresh ``mal_id`` in the catalog and correct the user's entry from it.
+
+    Title, image and episode count always follow the catalog. ``submitted``
+    holds the status and rating the entry was created with; each is only
+    replaced if the entry still has that value, so later edits are kept.
+    """
+    anime = Anime.objects.filter(mal_id=mal_id).first()
+    if anime is None or catalog.is_stale(anime.fetched_at):
+        # JikanError propagates so the job is retried
+        anime = catalog.refresh_anime(mal_id, anime=anime)
+
+    entry = Watchlist.objects.filter(user_id=user_id, mal_id=mal_id).first()
+    if entry is None:
+        return
+    before = copy(entry)
+    entry.title = anime.display_title[:255] or entry.title
+    entry.image_url = anime.image_url or entry.image_url
+    entry.total_episodes = anime.episodes or entry.total_episodes
+    submitted = submitted or {}
+    if 'status' in submitted and entry.status == submitted['status']:
+        entry.status = catalog.status_color(anime.status)['label']
+    if 'rating' in submitted and entry.rating == submitted['rating']:
+        entry.rating = anime.score
+    changed = [
+        field for field in ('title', 'image_url', 'total_episodes', 'status', 'rating')
+        if getattr(before, field) != getattr(entry, field)
+    ]
+    if changed:
+        with transaction.atomic():
+            entry.save(update_fields=changed)
+            stats.record_watchlist_change(user_id, before, entry)
+
+
+@jobs.task()
+def reconcile_post_counts(post_id):
+    counters.reconcile_post_counts([post_id])
+
+
+@jobs.task()
+def deliver_notifications(verb, target_id):
+    notifications.deliver(verb, target_id)
@@ -1,3 +1,1289 @@
-from django.test import TestCase
+from io import StringIO
+import base64
+import gzip
+import io
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from application.models import AllPosts, Anime, CatalogSyncCheckpoint, Comment, CommentLike, Follow, Job, Notification, PostLike, RateLimitWindow, TimelineEntry, UserProfile, Watchlist, WatchlistStats
+from application import catalog, counters, explore_search, jikan, jobs, notifications, realtime, stats, timeline, title_index, watchlist_import
+from application.jikan import JikanClient, JikanError
+from application.ratelimit import DatabaseRateLimiter, RateLimiter, SharedRateLimiter, jikan_limiter
+from application.stats import watchlist_stats
+from application.views import feed_page, watchlist_page
+
+
+class FeedQueryCountTests(TestCase):
+    """Rendering posts and comments must not issue per-row queries for authors or avatars."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer')
+        UserProfile.objects.create(user=self.viewer)
+        self.client.force_login(self.viewer)
+        self.authors = []
+        for i in range(5):
+            author = User.objects.create_user(f'author{i}')
+            UserProfile.objects.create(
+                user=author, profile_picture=f'profile_pics/author{i}.png', has_profile_picture=True
+            )
+            self.authors.append(author)
+
+    def create_posts(self, count):
+        for i in range(count):
+            AllPosts.objects.create(user=self.authors[i % len(self.authors)], content=f'post {i}')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_count_is_constant(self):
+        self.create_posts(2)
+        small = self.count_queries(reverse('home'))
+        self.create_posts(15)
+        large = self.count_queries(reverse('home'))
+        self.assertEqual(small, large)
+
+    def test_post_detail_query_count_is_constant(self):
+        post = AllPosts.objects.create(user=self.authors[0], content='post')
+        Comment.objects.create(post=post, user=self.authors[1], content='first')
+        small = self.count_queries(reverse('post_detail', args=[post.id]))
+        for i in range(10):
+            Comment.objects.create(post=post, user=self.authors[i % len(self.authors)], content=f'comment {i}')
+        large = self.count_queries(reverse('post_detail', args=[post.id]))
+        self.assertEqual(small, large)
+
+    def test_feed_renders_author_avatars(self):
+        self.create_posts(1)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'profile_pics/author0.png')
+
+
+class FeedPaginationTests(TestCase):
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('reader')
+        self.client.force_login(self.viewer)
+        author = User.objects.create_user('poster')
+        now = timezone.now()
+        # Posts 2-4 share a timestamp, so the cursor has to break ties on id
+        offsets = [5, 3, 3, 3, 1]
+        self.posts = []
+        for number, minutes in enumerate(offsets):
+            post = AllPosts.objects.create(user=author, content=f'post {number}')
+            AllPosts.objects.filter(pk=post.pk).update(created_at=now - timedelta(minutes=minutes))
+            self.posts.append(post.pk)
+
+    def test_pages_cover_the_feed_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            posts, cursor = feed_page(self.viewer, cursor=cursor, page_size=2)
+            seen.extend(post.pk for post in posts)
+            if cursor is None:
+                break
+        expected = [self.posts[4], self.posts[3], self.posts[2], self.posts[1], self.posts[0]]
+        self.assertEqual(seen, expected)
+
+    def test_last_full_page_has_no_cursor(self):
+        posts, cursor = feed_page(self.viewer, page_size=5)
+        self.assertEqual(len(posts), 5)
+        self.assertIsNone(cursor)
+        self.assertEqual(feed_page(self.viewer, page_size=10), (posts, None))
+
+    def test_fetch_more_posts_endpoint(self):
+        malformed = [base64.urlsafe_b64encode(raw).decode() for raw in (b'yesterday|1', b'2024-01-01T00:00:00|x')]
+        for bad in ['not-a-cursor', *malformed]:
+            response = self.client.get(reverse('fetch_more_posts'), {'cursor': bad})
+            self.assertEqual(response.status_code, 400)
+
+        cursor = feed_page(self.viewer, page_size=3)[1]
+        data = self.client.get(reverse('fetch_more_posts'), {'cursor': cursor}).json()
+        self.assertFalse(data['has_next'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn(f'data-post-likes="{self.posts[1]}"', data['html'])
+        self.assertIn(f'data-post-likes="{self.posts[0]}"', data['html'])
+        self.assertNotIn(f'data-post-likes="{self.posts[2]}"', data['html'])
+
+
+class CommentCountTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('commenter')
+        self.client.force_login(self.user)
+        self.post = AllPosts.objects.create(user=User.objects.create_user('author'), content='post')
+
+    def comments_count(self):
+        return AllPosts.objects.values_list('comments_count', flat=True).get(pk=self.post.pk)
+
+    def test_comment_writes_move_the_stored_count(self):
+        for text in ('first', 'second', '', 'x' * 281):
+            self.client.post(reverse('add_comment', args=[self.post.pk]), {'content': text})
+        self.assertEqual(self.comments_count(), 2)
+
+        comment = Comment.objects.filter(post=self.post).first()
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.client.post(reverse('delete_comment', args=[comment.pk]))
+        self.assertEqual(self.comments_count(), 2)
+        self.client.force_login(self.user)
+        self.client.post(reverse('delete_comment', args=[comment.pk]))
+        self.assertEqual(self.comments_count(), 1)
+        # Each write also queues one debounced reconciliation for the post
+        self.assertEqual(Job.objects.filter(name='reconcile_post_counts', status=Job.QUEUED).count(), 1)
+
+    def test_count_never_goes_below_zero(self):
+        comment = Comment.objects.create(post=self.post, user=self.user, content='counted elsewhere')
+        self.client.post(reverse('delete_comment', args=[comment.pk]))
+        self.assertEqual(self.comments_count(), 0)
+
+    def test_reconcile_repairs_drift(self):
+        Comment.objects.create(post=self.post, user=self.user, content='one')
+        Comment.objects.create(post=self.post, user=self.user, content='two')
+        untouched = AllPosts.objects.create(user=self.user, content='quiet')
+        AllPosts.objects.filter(pk=self.post.pk).update(comments_count=7)
+
+        self.assertEqual(counters.reconcile_post_counts([untouched.pk]), 0)
+        self.assertEqual(self.comments_count(), 7)
+        out = StringIO()
+        call_command('reconcile_post_counts', stdout=out)
+        self.assertIn('Corrected 1 post(s)', out.getvalue())
+        self.assertEqual(self.comments_count(), 2)
+        self.assertEqual(counters.reconcile_post_counts(), 0)
+
+
+class LikeCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('liker')
+        self.client.force_login(self.user)
+        self.post = AllPosts.objects.create(user=User.objects.create_user('author'), content='post')
+        self.comment = Comment.objects.create(post=self.post, user=self.post.user, content='comment')
+
+    def like(self, name, pk):
+        return self.client.post(reverse(name, args=[pk]))
+
+    def test_post_and_comment_likes_toggle_their_counters(self):
+        self.assertEqual(self.like('toggle_like', self.post.pk).json(), {'liked': True, 'likes_count': 1})
+        self.assertEqual(self.like('toggle_like', self.post.pk).json(), {'liked': False, 'likes_count': 0})
+        self.assertEqual(self.like('toggle_comment_like', self.comment.pk).json(), {'liked': True, 'likes_count': 1})
+        self.assertTrue(CommentLike.objects.filter(user=self.user, comment=self.comment).exists())
+        self.assertEqual(self.like('toggle_comment_like', self.comment.pk).json(), {'liked': False, 'likes_count': 0})
+
+    def test_counter_never_goes_below_zero(self):
+        PostLike.objects.create(user=self.user, post=self.post)
+        self.assertEqual(self.like('toggle_like', self.post.pk).json(), {'liked': False, 'likes_count': 0})
+
+    def test_concurrent_duplicate_like_is_not_counted_twice(self):
+        AllPosts.objects.filter(pk=self.post.pk).update(likes_count=1)
+        # Another request inserted the like between our delete and insert
+        with mock.patch.object(PostLike.objects, 'create', side_effect=IntegrityError):
+            liked, likes_count = counters.toggle_like(PostLike, AllPosts, 'post', self.post.pk, self.user)
+        self.assertEqual((liked, likes_count), (True, 1))
+
+    def test_missing_targets_are_404(self):
+        self.assertEqual(self.like('toggle_like', 999).status_code, 404)
+        self.assertEqual(self.like('toggle_comment_like', 999).status_code, 404)
+        self.assertFalse(PostLike.objects.exists())
+
+
+class ProfileImageFlagTests(TestCase):
+    """Profile image URLs come from stored flags instead of filesystem checks."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.profile = UserProfile.objects.create(user=User.objects.create_user('someone'))
+
+    def test_upload_and_removal_set_flag(self):
+        self.profile.profile_picture = SimpleUploadedFile('me.png', b'image-bytes', content_type='image/png')
+        self.profile.save()
+        self.assertTrue(self.profile.has_profile_picture)
+        self.assertIn('profile_pics/me', self.profile.profile_picture_url)
+
+        self.profile.profile_picture = None
+        self.profile.save()
+        self.assertFalse(self.profile.has_profile_picture)
+        self.assertIn('images/profile_pics/img.png', self.profile.profile_picture_url)
+
+    def test_check_profile_images_clears_missing_files(self):
+        self.profile.profile_picture = SimpleUploadedFile('me.png', b'image-bytes', content_type='image/png')
+        self.profile.save()
+        self.profile.profile_picture.storage.delete(self.profile.profile_picture.name)
+
+        call_command('check_profile_images', stdout=StringIO())
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.has_profile_picture)
+
+
+class WatchlistStatsTests(TestCase):
+
+    def test_counts_in_one_query(self):
+        user = User.objects.create_user('stats')
+        entries = [
+            ('completed', 12, True), ('completed', 24, False), ('watching', 10, True),
+            ('plan_to_watch', 0, False), ('dropped', 5, False),
+        ]
+        for mal_id, (status, episodes, favorite) in enumerate(entries, start=1):
+            Watchlist.objects.create(
+                user=user, mal_id=mal_id, title=f'anime {mal_id}', status=status,
+                total_episodes=episodes, is_favorite=favorite
+            )
+        Watchlist.objects.create(user=User.objects.create_user('other'), mal_id=1, title='other', status='completed')
+
+        with self.assertNumQueries(1):
+            stats = watchlist_stats(user)
+        self.assertEqual(stats, {
+            'total': 5, 'favorites': 2, 'total_episodes': 36,
+            'completed': 2, 'watching': 1, 'plan_to_watch': 1, 'dropped': 1,
+            'rating_sum': 0, 'rated_count': 0,
+        })
+
+    def test_materialized_stats_follow_watchlist_writes(self):
+        user = User.objects.create_user('writer')
+        self.client.force_login(user)
+        WatchlistStats.objects.create(user=user)
+        self.client.post(
+            reverse('add_or_update_anime'),
+            data={'mal_id': 1, 'title': 'One', 'status': 'completed', 'rating': 8, 'is_exist': True},
+            content_type='application/json',
+        )
+        self.client.post(
+            reverse('add_or_update_anime'),
+            data={'mal_id': 2, 'title': 'Two', 'status': 'watching', 'rating': 6, 'is_exist': True},
+            content_type='application/json',
+        )
+        self.client.post(reverse('add_to_favorite'), {'mal_id': '2'})
+        self.client.post(
+            reverse('add_or_update_anime'),
+            data={'mal_id': 2, 'title': 'Two', 'status': 'dropped', 'rating': 4, 'is_exist': True},
+            content_type='application/json',
+        )
+        self.client.post(reverse('delete_anime', args=[1]))
+
+        stored = WatchlistStats.objects.get(user=user)
+        expected = watchlist_stats(user)
+        self.assertEqual({field: getattr(stored, field) for field in expected}, expected)
+        self.assertEqual((stored.total, stored.dropped, stored.favorites, stored.mean_rating), (1, 1, 1, 4))
+
+
+class WatchlistPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('collector')
+        self.client.force_login(self.user)
+        ratings = [8, None, 8, 6, None, 9, 6, 7]
+        for mal_id, rating in enumerate(ratings, start=1):
+            Watchlist.objects.create(
+                user=self.user, mal_id=mal_id, title=f'anime {mal_id % 3}', rating=rating,
+                status='completed' if mal_id % 2 else 'watching', is_favorite=mal_id > 6
+            )
+
+    def walk(self, **filters):
+        seen, cursor = [], None
+        while True:
+            entries, cursor = watchlist_page(self.user, cursor=cursor, page_size=3, **filters)
+            seen.extend(entry.mal_id for entry in entries)
+            if cursor is None:
+                return seen
+
+    def test_keyset_pages_match_full_ordering(self):
+        self.assertEqual(self.walk(sort='rating'), [6, 3, 1, 8, 7, 4, 5, 2])
+        self.assertEqual(self.walk(sort='title'), [3, 6, 1, 4, 7, 2, 5, 8])
+        self.assertEqual(self.walk(sort='added_at'), [8, 7, 6, 5, 4, 3, 2, 1])
+        self.assertEqual(self.walk(sort='rating', status='watching'), [6, 8, 4, 2])
+        self.assertEqual(self.walk(sort='title', favorite=True), [7, 8])
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan')
+    def test_every_sort_and_filter_reads_an_index_in_order(self):
+        for sort in ('added_at', 'title', 'rating'):
+            for filters in ({}, {'status': 'watching'}, {'favorite': True}):
+                with CaptureQueriesContext(connection) as queries:
+                    watchlist_page(self.user, sort=sort, **filters)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('USING INDEX watchlist_', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_fetch_more_endpoint(self):
+        response = self.client.get(reverse('watchlist'), {'sort': 'title', 'status': 'completed'})
+        self.assertEqual(response.context['watchlist_length'], 4)
+
+        response = self.client.get(reverse('fetch_more_watchlist'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        cursor = watchlist_page(self.user, sort='title', page_size=2)[1]
+        data = self.client.get(reverse('fetch_more_watchlist'), {'sort': 'title', 'cursor': cursor}).json()
+        self.assertFalse(data['has_next'])
+        self.assertIn('data-mal-id="1"', data['html'])
+        self.assertNotIn('data-mal-id="3"', data['html'])
+
+
+class ExploreCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Background prefetching is exercised on its own below
+        prefetch_off = mock.patch('application.explore_search.PREFETCH_LIMIT', 0)
+        prefetch_off.start()
+        self.addCleanup(prefetch_off.stop)
+        self.user = User.objects.create_user('explorer')
+        self.client.force_login(self.user)
+        Watchlist.objects.create(user=self.user, mal_id=2, title='Two', is_favorite=True)
+        self.payload = {
+            'data': [{'mal_id': 1, 'title': 'One', 'status': 'Currently Airing'}, {'mal_id': 2, 'title': 'Two'}],
+            'pagination': {'has_next_page': True, 'current_page': 1, 'items': {'total': 50}},
+        }
+
+    def test_equivalent_filters_share_one_upstream_call(self):
+        with mock.patch('application.jikan.aget', return_value=self.payload) as aget:
+            first = self.client.get(reverse('explore'), {'genre': 'action', 'sort': 'rating'})
+            second = self.client.get(reverse('explore'), {'sort': 'rating', 'genre': 'Action', 'year': ''})
+        self.assertEqual(aget.call_count, 1)
+        self.assertEqual(first.context['anime_list'], second.context['anime_list'])
+
+        one, two = second.context['anime_list']
+        self.assertEqual((one['is_in_watchlist'], one['status_color']['label']), (False, 'ongoing'))
+        self.assertEqual((two['is_in_watchlist'], two['is_favorite']), (True, True))
+
+    def test_fetch_more_uses_the_same_pipeline(self):
+        with mock.patch('application.jikan.aget', return_value=self.payload) as aget:
+            self.client.get(reverse('explore'))
+            data = self.client.get(reverse('fetch_more_anime'), {'page': '2', 'sort': ''}).json()
+        (first_endpoint, first), (second_endpoint, second) = [(c.args[0], c.kwargs['params']) for c in aget.call_args_list]
+        self.assertEqual(first_endpoint, second_endpoint)
+        self.assertEqual({**first, 'page': 2}, second)
+        self.assertEqual(data['next_api_page'], 3)
+        self.assertEqual([anime['is_in_watchlist'] for anime in data['anime']], [False, True])
+
+    # The prefetch thread has its own database connection, outside this test's transaction
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_next_page_is_prefetched_into_the_cache(self):
+        filters = explore_search.filters_from_query({'genre': 'Drama'})
+        release = threading.Event()
+
+        def slow_get(*args, **kwargs):
+            release.wait(5)
+            return self.payload
+
+        with mock.patch('application.explore_search.PREFETCH_LIMIT', 1), \
+                mock.patch('application.jikan.get', side_effect=slow_get) as get:
+            future = explore_search.prefetch(filters, 2)
+            # Over the cap while page 2 is still in flight
+            self.assertIsNone(explore_search.prefetch(filters, 3))
+            release.set()
+            future.result(timeout=5)
+        self.assertEqual(get.call_args.kwargs['params']['page'], 2)
+
+        with mock.patch('application.jikan.aget') as aget:
+            data = self.client.get(reverse('fetch_more_anime'), {'page': '2', 'genre': 'Drama'}).json()
+        aget.assert_not_called()
+        self.assertEqual(len(data['anime']), 2)
+
+
+class JikanClientTests(SimpleTestCase):
+
+    @staticmethod
+    def local_client(**kwargs):
+        """A client with only the in-process cache."""
+        return JikanClient(limiter=RateLimiter([(100, 1)]), cache_alias=None, **kwargs)
+
+    def cached_client(self, path, body, age):
+        client = self.local_client(stale_ttl=600)
+        key = client.cache_key(path)
+        client.local.set(key, (body, time.time() - age, jikan.ttl_for(path)))
+        return client
+
+    def test_fresh_hits_skip_the_network_and_are_copies(self):
+        client = self.local_client()
+        with mock.patch.object(client, '_fetch', return_value='{"data": {"genres": []}}') as fetch:
+            first = client.get('anime/1')
+            first['data']['genres'].append('mutated')
+            second = client.get('/anime/1/')
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(second, {'data': {'genres': []}})
+
+    def test_ttl_depends_on_the_endpoint(self):
+        self.assertEqual(jikan.ttl_for('anime/1/characters'), 24 * 60 * 60)
+        self.assertEqual(jikan.ttl_for('anime/1'), 6 * 60 * 60)
+        self.assertEqual(jikan.ttl_for('top/anime'), 60 * 60)
+        self.assertEqual(jikan.ttl_for('anime'), 15 * 60)
+        self.assertEqual(jikan.ttl_for('genres/anime'), jikan.DEFAULT_TTL)
+
+    def test_stale_hit_is_served_then_revalidated_in_the_background(self):
+        client = self.cached_client('anime', '{"data": "old"}', age=jikan.ttl_for('anime') + 60)
+        with mock.patch.object(client, '_fetch', return_value='{"data": "new"}') as fetch:
+            self.assertEqual(client.get('anime'), {'data': 'old'})
+            deadline = time.monotonic() + 2
+            while client._refreshing and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(client.get('anime'), {'data': 'new'})
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_expired_copy_is_only_a_fallback_when_jikan_fails(self):
+        client = self.cached_client('anime', '{"data": "old"}', age=jikan.ttl_for('anime') + 700)
+        with mock.patch.object(client, '_fetch', side_effect=JikanError('down', 503)):
+            self.assertEqual(client.get('anime'), {'data': 'old'})
+        with mock.patch.object(client, '_fetch', return_value='{"data": "new"}'):
+            self.assertEqual(client.get('anime'), {'data': 'new'})
+        with mock.patch.object(client, '_fetch', side_effect=JikanError('down', 503)):
+            with self.assertRaises(JikanError):
+                client.get('anime/5')
+
+    def test_concurrent_misses_share_one_request(self):
+        client = self.local_client()
+        calls = []
+
+        def slow_fetch(path, params, max_wait):
+            calls.append(path)
+            time.sleep(0.2)
+            return '{"data": []}'
+
+        results = []
+        with mock.patch.object(client, '_fetch', side_effect=slow_fetch):
+            threads = [threading.Thread(target=lambda: results.append(client.get('anime', {'q': 'x'}))) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, ['anime'])
+        self.assertEqual(results, [{'data': []}] * 5)
+
+    def test_cancelled_follower_does_not_fail_the_leader(self):
+        client = self.local_client()
+        started = threading.Event()
+        results = []
+
+        def slow_fetch(path, params, max_wait):
+            started.set()
+            time.sleep(0.3)
+            return '{"data": 1}'
+
+        async def cancelled_follower():
+            task = asyncio.ensure_future(client.aget('anime/1'))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(client, '_fetch', side_effect=slow_fetch):
+            leader = threading.Thread(target=lambda: results.append(client.get('anime/1')))
+            leader.start()
+            started.wait(1)
+            asyncio.run(cancelled_follower())
+            leader.join()
+        self.assertEqual(results, [{'data': 1}])
+
+    def test_async_get_reuses_the_session_without_async_http(self):
+        client = self.local_client(async_http=False)
+        response = mock.Mock(status_code=200, text='{"data": 2}')
+        with mock.patch.object(client.session, 'get', return_value=response) as get:
+            for _ in range(3):
+                self.assertEqual(asyncio.run(client.aget('anime/2')), {'data': 2})
+            asyncio.run(client.aget('anime/3'))
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(len(client._async_clients), 0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_clients_sharing_a_cache_make_one_request(self):
+        # Each client stands in for a worker process with its own LRU and in-flight map
+        first, second = (JikanClient(limiter=RateLimiter([(100, 1)]), cache_alias='default') for _ in range(2))
+        calls, results = [], []
+        started = threading.Event()
+
+        def slow_fetch(path, params, max_wait):
+            calls.append(path)
+            started.set()
+            time.sleep(0.2)
+            return '{"data": 3}'
+
+        with mock.patch.object(first, '_fetch', side_effect=slow_fetch), \
+                mock.patch.object(second, '_fetch', side_effect=slow_fetch):
+            leader = threading.Thread(target=lambda: results.append(first.get('anime/3')))
+            leader.start()
+            started.wait(1)
+            results.append(second.get('anime/3'))
+            leader.join()
+        self.assertEqual(calls, ['anime/3'])
+        self.assertEqual(results, [{'data': 3}] * 2)
+
+
+class SharedRateLimitTests(TestCase):
+
+    def test_default_limiter_counts_in_the_database(self):
+        limiter = jikan_limiter()
+        self.assertIsInstance(limiter, DatabaseRateLimiter)
+        limiter.limits = [(2, 60), (5, 3600)]
+        self.assertEqual([limiter.try_acquire() for _ in range(2)], [0, 0])
+        self.assertGreater(limiter.try_acquire(), 0)
+        # The refused request's increments were rolled back in every window
+        self.assertEqual(
+            sorted(RateLimitWindow.objects.values_list('count', flat=True)), [2, 2]
+        )
+        # Another process's limiter draws from the same windows
+        self.assertGreater(DatabaseRateLimiter(limits=limiter.limits).try_acquire(), 0)
+
+        client = JikanClient(limiter=limiter, rate_limit_wait=0)
+        with self.assertRaises(JikanError) as raised:
+            client.get('anime/1')
+        self.assertEqual(raised.exception.status_code, 429)
+
+    def test_cache_limiter_counts_in_the_shared_cache(self):
+        limiter = SharedRateLimiter('default', limits=[(2, 60)], prefix='test:jikan')
+        self.assertEqual([limiter.try_acquire() for _ in range(2)], [0, 0])
+        self.assertGreater(SharedRateLimiter('default', limits=[(2, 60)], prefix='test:jikan').try_acquire(), 0)
+
+
+class AsyncViewTests(TestCase):
+    """The Jikan-backed views run as coroutines end to end."""
+
+    def setUp(self):
+        cache.clear()
+        prefetch_off = mock.patch('application.explore_search.PREFETCH_LIMIT', 0)
+        prefetch_off.start()
+        self.addCleanup(prefetch_off.stop)
+        self.user = User.objects.create_user('async-viewer')
+        Watchlist.objects.create(user=self.user, mal_id=2, title='Two')
+        self.payload = {
+            'data': [{'mal_id': 1, 'title': 'One'}, {'mal_id': 2, 'title': 'Two'}],
+            'pagination': {'has_next_page': True, 'current_page': 1, 'items': {'total': 50}},
+        }
+
+    async def test_explore_and_fetch_more(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('application.jikan.aget', return_value=self.payload) as aget:
+            response = await self.async_client.get(reverse('explore'), {'genre': 'Drama'})
+            more = await self.async_client.get(reverse('fetch_more_anime'), {'genre': 'Drama', 'page': '2'})
+        self.assertEqual(aget.await_count, 2)
+        self.assertEqual(aget.await_args.kwargs['params']['page'], 2)
+        self.assertEqual(response.context['total_results'], 50)
+        self.assertEqual([anime['is_in_watchlist'] for anime in response.context['anime_list']], [False, True])
+        self.assertEqual(more.json()['next_api_page'], 3)
+
+    async def test_anime_details(self):
+        await self.async_client.aforce_login(self.user)
+
+        async def aget(path, params=None):
+            if path.endswith('/characters'):
+                return {'data': []}
+            return CatalogTests.detail(5)
+
+        with mock.patch('application.jikan.aget', side_effect=aget):
+            response = await self.async_client.get(reverse('anime_details', args=[5]))
+        self.assertContains(response, 'Cowboy Bebop')
+        self.assertTrue(await Anime.objects.filter(mal_id=5).aexists())
+
+        with mock.patch('application.jikan.aget', side_effect=JikanError('missing', 404)):
+            response = await self.async_client.get(reverse('anime_details', args=[6]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_add_to_watchlist(self):
+        await self.async_client.aforce_login(self.user)
+        await Anime.objects.acreate(mal_id=7, title='Seven', episodes=12, fetched_at=timezone.now())
+        url = reverse('add_to_watchlist')
+        with mock.patch('application.jikan.aget') as aget:
+            created = await self.async_client.post(url, {'mal_id': '7'})
+            duplicate = await self.async_client.post(url, {'mal_id': '7'})
+            invalid = await self.async_client.post(url, {'mal_id': 'seven'})
+        aget.assert_not_called()
+        self.assertEqual((created.status_code, duplicate.status_code, invalid.status_code), (201, 400, 400))
+        entry = await Watchlist.objects.aget(user=self.user, mal_id=7)
+        self.assertEqual((entry.title, entry.total_episodes), ('Seven', 12))
+
+
+class CatalogTests(TestCase):
+
+    @staticmethod
+    def detail(mal_id, title='Cowboy Bebop'):
+        return {'data': {
+            'mal_id': mal_id, 'title': title, 'status': 'Finished Airing', 'score': 8.8, 'episodes': 26,
+            'images': {'webp': {'large_image_url': f'https://img/{mal_id}.webp'}}, 'genres': [{'name': 'Action'}],
+        }}
+
+    def test_missing_anime_is_fetched_once_then_read_locally(self):
+        with mock.patch('application.jikan.get', return_value=self.detail(1)) as get:
+            anime = catalog.get_anime(1)
+            again = catalog.get_anime(1)
+        get.assert_called_once_with('anime/1')
+        self.assertEqual((again.pk, again.title, again.episodes, again.genres), (anime.pk, 'Cowboy Bebop', 26, ['Action']))
+        self.assertEqual(again.image_url, 'https://img/1.webp')
+
+    def test_stale_rows_are_refreshed(self):
+        Anime.objects.create(mal_id=1, title='Old', fetched_at=timezone.now() - catalog.CATALOG_MAX_AGE - timedelta(hours=1))
+        with mock.patch('application.jikan.get', return_value=self.detail(1)):
+            self.assertEqual(catalog.get_anime(1).title, 'Cowboy Bebop')
+        self.assertEqual(Anime.objects.get(mal_id=1).title, 'Cowboy Bebop')
+
+    def test_stale_copy_is_served_when_jikan_fails(self):
+        Anime.objects.create(mal_id=1, title='Old', fetched_at=timezone.now() - catalog.CATALOG_MAX_AGE - timedelta(hours=1))
+        with mock.patch('application.jikan.get', side_effect=JikanError('down', 503)):
+            self.assertEqual(catalog.get_anime(1).title, 'Old')
+            with self.assertRaises(JikanError):
+                catalog.get_anime(2)
+
+    def characters(self, count=12):
+        return {'data': [
+            {'role': 'Main', 'character': {'name': f'Character {n}', 'mal_id': n, 'images': {'jpg': {'image_url': f'https://c/{n}.jpg'}}}}
+            for n in range(count)
+        ]}
+
+    def test_detail_and_characters_are_fetched_concurrently(self):
+        def slow_get(path, params=None):
+            time.sleep(0.2)
+            return self.characters() if path.endswith('/characters') else self.detail(1)
+
+        closed_in = []
+        started = time.monotonic()
+        with mock.patch('application.jikan.get', side_effect=slow_get), \
+                mock.patch.object(catalog.connections, 'close_all', side_effect=lambda: closed_in.append(threading.current_thread().name)):
+            anime = catalog.refresh_anime(1, with_characters=True)
+        self.assertLess(time.monotonic() - started, 0.35)
+        # The executor thread doesn't keep the rate limiter's connection open
+        self.assertEqual(len(closed_in), 1)
+        self.assertTrue(closed_in[0].startswith('catalog'))
+        self.assertEqual(len(anime.characters), catalog.CHARACTER_LIMIT)
+        self.assertEqual(anime.characters[0], {
+            'role': 'Main', 'character': {'name': 'Character 0', 'images': {'jpg': {'image_url': 'https://c/0.jpg'}}},
+        })
+        self.assertIsNotNone(anime.characters_fetched_at)
+
+    def test_slow_characters_do_not_hold_up_the_page(self):
+        release = threading.Event()
+
+        def get(path, params=None):
+            if path.endswith('/characters'):
+                release.wait(2)
+                return self.characters()
+            return self.detail(1)
+
+        with mock.patch('application.jikan.get', side_effect=get):
+            anime = catalog.refresh_anime(1, with_characters=True, characters_timeout=0.05)
+            release.set()
+        self.assertEqual((anime.title, anime.characters_fetched_at), ('Cowboy Bebop', None))
+
+    async def test_async_refresh_fetches_both_and_cancels_characters_on_failure(self):
+        async def aget(path, params=None):
+            await asyncio.sleep(0.1)
+            return self.characters(3) if path.endswith('/characters') else self.detail(1)
+
+        with mock.patch('application.jikan.aget', side_effect=aget):
+            anime = await catalog.arefresh_anime(1, with_characters=True)
+        self.assertEqual((anime.title, len(anime.characters)), ('Cowboy Bebop', 3))
+
+        characters_cancelled = asyncio.Event()
+
+        async def failing_aget(path, params=None):
+            if path.endswith('/characters'):
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    characters_cancelled.set()
+                    raise
+            await asyncio.sleep(0.05)
+            raise JikanError('down', 503)
+
+        with mock.patch('application.jikan.aget', side_effect=failing_aget):
+            with self.assertRaises(JikanError):
+                await catalog.arefresh_anime(2, with_characters=True)
+        await asyncio.wait_for(characters_cancelled.wait(), 1)
+
+    def test_detail_view_reads_the_catalog(self):
+        self.client.force_login(User.objects.create_user('viewer'))
+        Anime.objects.create(
+            mal_id=1, title='Cowboy Bebop', fetched_at=timezone.now(), characters=[], characters_fetched_at=timezone.now(),
+            data={'mal_id': 1, 'title': 'Cowboy Bebop', 'synopsis': 'Space bounty hunters.'},
+        )
+        with mock.patch('application.jikan.aget') as aget:
+            response = self.client.get(reverse('anime_details', args=[1]))
+        aget.assert_not_called()
+        self.assertContains(response, 'Space bounty hunters.')
+
+
+class CatalogSyncTests(TestCase):
+
+    def listing(self, endpoint, params):
+        page = params['page']
+        return {
+            'data': [{'mal_id': page * 100 + number, 'title': f'Page {page} #{number}'} for number in range(2)],
+            'pagination': {'has_next_page': page < 3},
+        }
+
+    def sync(self, *args):
+        call_command('sync_anime_catalog', '--source', 'anime', '--workers', '2', *args, stdout=StringIO())
+
+    def test_walks_pages_and_checkpoints_progress(self):
+        with mock.patch('application.jikan.client.fetch', side_effect=self.listing) as fetch:
+            self.sync('--max-pages', '2')
+            self.assertEqual(CatalogSyncCheckpoint.objects.get(endpoint='anime').page, 2)
+            self.sync()
+        # Pages are fetched two at a time, so page 4 is requested alongside the last one
+        self.assertEqual(sorted(c.args[1]['page'] for c in fetch.call_args_list), [1, 2, 3, 4])
+        self.assertEqual(sorted(Anime.objects.values_list('mal_id', flat=True)), [100, 101, 200, 201, 300, 301])
+        # A finished walk starts over next time
+        self.assertEqual(CatalogSyncCheckpoint.objects.get(endpoint='anime').page, 0)
+
+    def test_retries_rate_limits_and_stops_resumably_on_errors(self):
+        responses = [JikanError('slow down', 429), self.listing('anime', {'page': 1}), JikanError('gone', 404)]
+        with mock.patch('application.jikan.client.fetch', side_effect=responses), \
+                mock.patch('application.management.commands.sync_anime_catalog.time.sleep') as sleep:
+            with self.assertRaises(CommandError):
+                call_command('sync_anime_catalog', '--source', 'anime', '--workers', '1', stdout=StringIO())
+        sleep.assert_called_once_with(1)
+        self.assertEqual(CatalogSyncCheckpoint.objects.get(endpoint='anime').page, 1)
+        self.assertEqual(Anime.objects.count(), 2)
+
+
+class TitleIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        title_index.index.reset()
+        self.addCleanup(title_index.index.reset)
+        patcher = mock.patch.object(title_index.index, 'background', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('searcher')
+        self.client.force_login(self.user)
+        for mal_id, title, english, synonyms in [
+            (1535, 'Death Note', 'Death Note', ['DN']),
+            (5114, 'Fullmetal Alchemist: Brotherhood', 'Fullmetal Alchemist: Brotherhood', ['Hagane no Renkinjutsushi']),
+            (16498, 'Shingeki no Kyojin', 'Attack on Titan', []),
+        ]:
+            Anime.objects.create(
+                mal_id=mal_id, title=title, title_english=english, episodes=25, fetched_at=timezone.now(),
+                image_url=f'https://img/{mal_id}.webp',
+                data={'mal_id': mal_id, 'title': title, 'title_english': english, 'title_synonyms': synonyms},
+            )
+
+    def test_fuzzy_matches_titles_and_synonyms(self):
+        self.assertEqual(title_index.search('atack on titan')[0][0], 16498)
+        self.assertEqual(title_index.search('hagane renkinjutsushi')[0][0], 5114)
+        self.assertEqual(title_index.search('full metal alchemist')[0][0], 5114)
+        self.assertEqual(title_index.search('bleach'), [])
+
+    def test_other_users_watchlist_titles_are_not_indexed(self):
+        prankster = User.objects.create_user('prankster')
+        Watchlist.objects.create(user=prankster, mal_id=1, title='Attack on Titan', status='watching')
+        Watchlist.objects.create(user=prankster, mal_id=2, title='Bleach', status='watching')
+        self.assertEqual(title_index.resolve('attack on titan')[0], 16498)
+        self.assertIsNone(title_index.resolve('bleach'))
+
+    def test_background_refresh_does_not_block_searches(self):
+        index = title_index.TitleIndex(background=True)
+        building = threading.Event()
+        release = threading.Event()
+
+        def slow_refresh(force=False):
+            building.set()
+            release.wait(2)
+
+        with mock.patch.object(index, 'refresh', side_effect=slow_refresh) as refresh:
+            self.assertEqual(index.search('death note'), [])
+            building.wait(1)
+            self.assertEqual(index.search('death note'), [])
+            release.set()
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_add_resolves_title_locally(self):
+        with mock.patch('application.jikan.get') as get:
+            response = self.client.post(
+                reverse('add_or_update_anime'),
+                data={'title': 'shingeki no kyojin', 'status': 'watching', 'rating': 9},
+                content_type='application/json',
+            )
+        get.assert_not_called()
+        self.assertEqual(response.json()['mal_id'], 16498)
+        entry = Watchlist.objects.get(user=self.user)
+        self.assertEqual((entry.title, entry.total_episodes), ('Attack on Titan', 25))
+
+    def test_explore_title_search_is_answered_and_paged_locally(self):
+        count = explore_search.PAGE_LIMIT + 6
+        for number in range(1, count + 1):
+            Anime.objects.create(
+                mal_id=90000 + number, title=f'Mobile Suit Gundam {number}', fetched_at=timezone.now(),
+                data={'mal_id': 90000 + number, 'title': f'Mobile Suit Gundam {number}'},
+            )
+        title_index.index.refresh(force=True)
+        with mock.patch('application.jikan.aget') as aget, mock.patch('application.jikan.get') as get:
+            response = self.client.get(reverse('explore'), {'search': 'mobile suit gundam'})
+            self.assertEqual(len(response.context['anime_list']), explore_search.PAGE_LIMIT)
+            self.assertEqual(response.context['total_results'], count)
+            self.assertEqual(response.context['next_api_page'], 2)
+            more = self.client.get(reverse('fetch_more_anime'), {'search': 'mobile suit gundam', 'page': 2}).json()
+        aget.assert_not_called()
+        get.assert_not_called()
+        self.assertFalse(more['has_next'])
+        shown = [anime['mal_id'] for anime in response.context['anime_list'] + more['anime']]
+        self.assertEqual(sorted(shown), list(range(90001, 90001 + count)))
+
+    def test_partial_local_matches_fall_back_to_jikan(self):
+        payload = {
+            'data': [{'mal_id': 1535, 'title': 'Death Note'}, {'mal_id': 2994, 'title': 'Death Note: Rewrite'}],
+            'pagination': {'has_next_page': True, 'current_page': 1, 'items': {'total': 30}},
+        }
+        with mock.patch('application.jikan.aget', return_value=payload) as aget, \
+                mock.patch('application.explore_search.PREFETCH_LIMIT', 0):
+            response = self.client.get(reverse('explore'), {'search': 'death note'})
+        aget.assert_called_once()
+        self.assertEqual([anime['mal_id'] for anime in response.context['anime_list']], [1535, 2994])
+        self.assertTrue(response.context['has_next_page'])
+
+
+class WatchlistImportTests(TestCase):
+
+    MAL_EXPORT = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<myanimelist>
+  <myinfo><user_name>someone</user_name></myinfo>
+  <anime>
+    <series_animedb_id>1535</series_animedb_id>
+    <series_title><![CDATA[Death Note]]></series_title>
+    <series_episodes>37</series_episodes>
+    <my_score>9</my_score>
+    <my_status>Completed</my_status>
+  </anime>
+  <anime>
+    <series_animedb_id>21</series_animedb_id>
+    <series_title><![CDATA[One Piece]]></series_title>
+    <series_episodes>0</series_episodes>
+    <my_score>0</my_score>
+    <my_status>Watching</my_status>
+  </anime>
+</myanimelist>"""
+
+    ANILIST_EXPORT = json.dumps({'data': {'MediaListCollection': {'lists': [
+        {'name': 'Completed', 'entries': [
+            {'status': 'COMPLETED', 'score': 85, 'media': {'idMal': 1535, 'title': {'romaji': 'Death Note'}, 'episodes': 37}},
+        ]},
+        {'name': 'Planning "entries"', 'entries': [
+            {'status': 'PLANNING', 'score': 0, 'media': {'idMal': 5114, 'title': {'english': 'Fullmetal Alchemist'}}},
+            {'status': 'PLANNING', 'score': 0, 'media': {'idMal': None, 'title': {'english': 'Unknown Show'}}},
+        ]},
+    ]}}}).encode()
+
+    def setUp(self):
+        title_index.index.reset()
+        self.addCleanup(title_index.index.reset)
+        patcher = mock.patch.object(title_index.index, 'background', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('importer')
+        self.client.force_login(self.user)
+        Anime.objects.create(mal_id=21, title='One Piece', image_url='https://img/21.webp', episodes=1100, fetched_at=timezone.now())
+
+    def test_mal_gzip_import_upserts_and_resolves_against_catalog(self):
+        Watchlist.objects.create(user=self.user, mal_id=1535, title='Death Note', status='watching', is_favorite=True)
+        upload = SimpleUploadedFile('animelist.xml.gz', gzip.compress(self.MAL_EXPORT))
+        with mock.patch('application.jikan.get') as get:
+            data = self.client.post(reverse('import_watchlist'), {'file': upload}).json()
+        get.assert_not_called()
+        self.assertEqual((data['imported'], data['skipped']), (2, 0))
+
+        death_note = Watchlist.objects.get(user=self.user, mal_id=1535)
+        self.assertEqual((death_note.status, death_note.rating, death_note.is_favorite), ('completed', 9, True))
+        one_piece = Watchlist.objects.get(user=self.user, mal_id=21)
+        self.assertEqual((one_piece.rating, one_piece.total_episodes, one_piece.image_url), (None, 1100, 'https://img/21.webp'))
+        self.assertEqual(WatchlistStats.objects.get(user=self.user).total, 2)
+
+    def test_anilist_json_import_streams_entries(self):
+        with mock.patch('application.watchlist_import.READ_SIZE', 16):
+            call_command('import_watchlist', 'importer', self.write_export(self.ANILIST_EXPORT), stdout=StringIO())
+        entries = dict(Watchlist.objects.filter(user=self.user).values_list('mal_id', 'rating'))
+        self.assertEqual(entries, {1535: 8.5, 5114: None})
+
+    def test_malformed_mal_numbers_are_skipped_not_fatal(self):
+        export = b"""<myanimelist>
+  <anime><series_animedb_id>abc</series_animedb_id><series_title>Nowhere Show</series_title><my_status>Watching</my_status></anime>
+  <anime><series_animedb_id>21</series_animedb_id><series_title>One Piece</series_title>
+    <series_episodes>lots</series_episodes><my_score>nan</my_score><my_status>Watching</my_status></anime>
+  <anime><series_animedb_id>30</series_animedb_id><series_title>Evangelion</series_title>
+    <series_episodes>2x6</series_episodes><my_score>eight</my_score><my_status>Completed</my_status></anime>
+</myanimelist>"""
+        response = self.client.post(reverse('import_watchlist'), {'file': SimpleUploadedFile('animelist.xml', export)})
+        self.assertEqual(response.json(), {'success': True, 'imported': 2, 'skipped': 1})
+        self.assertEqual(
+            set(Watchlist.objects.filter(user=self.user).values_list('mal_id', 'rating', 'total_episodes')),
+            {(21, None, 1100), (30, None, 0)},
+        )
+
+    def test_rejects_unknown_format(self):
+        response = self.client.post(reverse('import_watchlist'), {'file': SimpleUploadedFile('list.txt', b'hello')})
+        self.assertEqual(response.status_code, 400)
+
+    def test_parse_error_partway_through_rolls_back(self):
+        Watchlist.objects.create(user=self.user, mal_id=1535, title='Death Note', status='watching')
+        stats.rebuild_watchlist_stats(self.user.id)
+        broken = self.MAL_EXPORT.replace(b'</myanimelist>', b'<anime><series_animedb_id>5</series_animedb_id>')
+        with self.assertRaises(watchlist_import.ImportFormatError):
+            watchlist_import.import_watchlist(self.user, io.BytesIO(broken), chunk_size=1)
+        self.assertEqual(list(Watchlist.objects.filter(user=self.user).values_list('mal_id', 'status')), [(1535, 'watching')])
+        self.assertEqual(WatchlistStats.objects.get(user=self.user).total, 1)
+
+    def write_export(self, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = f'{directory}/export.json'
+        with open(path, 'wb') as export:
+            export.write(content)
+        return path
+
+
+class WatchlistExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        self.client.force_login(self.user)
+        Watchlist.objects.create(user=self.user, mal_id=1535, title='Death Note', status='completed', rating=9, total_episodes=37)
+        Watchlist.objects.create(user=self.user, mal_id=21, title='One Piece & Friends', status='on_hold')
+        Watchlist.objects.create(user=User.objects.create_user('other'), mal_id=5, title='Not mine')
+
+    def export(self, export_format):
+        response = self.client.get(reverse('export_watchlist', args=[export_format]))
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_and_jsonl(self):
+        lines = self.export('csv').decode().splitlines()
+        self.assertEqual(lines[0], 'mal_id,title,status,rating,is_favorite,total_episodes,added_at,image_url')
+        self.assertEqual(len(lines), 3)
+        rows = [json.loads(line) for line in self.export('jsonl').decode().splitlines()]
+        self.assertEqual([(row['mal_id'], row['rating']) for row in rows], [(1535, 9.0), (21, None)])
+
+    async def test_asgi_export_streams_from_an_async_iterator(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('export_watchlist', args=['csv']))
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(lines[0], 'mal_id,title,status,rating,is_favorite,total_episodes,added_at,image_url')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['1535', '21'])
+
+    def test_mal_xml_round_trips_through_import(self):
+        content = self.export('xml')
+        Watchlist.objects.filter(user=self.user).delete()
+        imported, skipped = watchlist_import.import_watchlist(self.user, io.BytesIO(content))
+        self.assertEqual((imported, skipped), (2, 0))
+        self.assertEqual(
+            set(Watchlist.objects.filter(user=self.user).values_list('mal_id', 'title', 'status', 'rating')),
+            {(1535, 'Death Note', 'completed', 9.0), (21, 'One Piece & Friends', 'on_hold', None)},
+        )
+
+    def test_unknown_format_is_404(self):
+        self.assertEqual(self.client.get(reverse('export_watchlist', args=['pdf'])).status_code, 404)
+
+
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob, self.carol = (User.objects.create_user(name) for name in ('alice', 'bob', 'carol'))
+
+    def post(self, user, content):
+        self.client.force_login(user)
+        self.client.post(reverse('new_post'), {'content': content})
+        # Run the queued fan-out
+        jobs.run_pending()
+        return AllPosts.objects.get(user=user, content=content)
+
+    def feed(self, user):
+        self.client.force_login(user)
+        return [post.content for post in self.client.get(reverse('home')).context['posts']]
+
+    def test_follow_backfills_and_fans_out(self):
+        self.post(self.bob, 'bob old')
+        self.post(self.carol, 'carol')
+        self.post(self.alice, 'alice')
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse('toggle_follow', args=[self.bob.id]))
+        self.assertEqual(response.json(), {'following': True, 'followers_count': 1})
+
+        self.post(self.bob, 'bob new')
+        self.assertEqual(self.feed(self.alice), ['bob new', 'alice', 'bob old'])
+        self.assertTrue(all(post.author_followed for post in self.client.get(reverse('home')).context['posts'] if post.user == self.bob))
+        # Users who follow nobody still see every post
+        self.assertEqual(len(self.feed(self.carol)), 4)
+
+    def test_unfollow_removes_posts(self):
+        self.post(self.bob, 'bob')
+        timeline.toggle_follow(self.alice, self.bob)
+        timeline.toggle_follow(self.alice, self.carol)
+        self.assertEqual(timeline.toggle_follow(self.alice, self.bob), (False, 0))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.alice, post__user=self.bob).exists())
+        self.assertEqual(self.feed(self.alice), [])
+
+    def test_author_sees_their_post_before_the_fanout_runs(self):
+        timeline.toggle_follow(self.alice, self.bob)
+        # Following someone switches bob's home page over to the timeline
+        timeline.toggle_follow(self.bob, self.carol)
+        self.client.force_login(self.bob)
+        self.client.post(reverse('new_post'), {'content': 'bob now'})
+        self.assertEqual(self.feed(self.bob), ['bob now'])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.alice).exists())
+        self.assertEqual(Job.objects.filter(name='fanout_post', status=Job.QUEUED).count(), 1)
+        jobs.run_pending()
+        self.assertEqual(self.feed(self.alice), ['bob now'])
+
+    def test_popular_authors_are_merged_at_read_time(self):
+        timeline.toggle_follow(self.alice, self.bob)
+        with mock.patch('application.timeline.FANOUT_FOLLOWER_LIMIT', 0):
+            self.post(self.bob, 'bob')
+            self.assertFalse(TimelineEntry.objects.filter(user=self.alice).exists())
+            self.assertEqual(self.feed(self.alice), ['bob'])
+
+    def test_cannot_follow_self(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.post(reverse('toggle_follow', args=[self.alice.id])).status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        registry = mock.patch.dict(jobs.registry, {
+            'record': (lambda **payload: self.calls.append(payload), 5),
+            'explode': (mock.Mock(side_effect=RuntimeError('boom')), 2),
+        })
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_queued_idempotency_key_is_deduplicated(self):
+        self.assertIsNotNone(jobs.enqueue('record', key='k', n=1))
+        self.assertIsNone(jobs.enqueue('record', key='k', n=2))
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [{'n': 1}])
+        # Once the first copy has run the key can be queued again
+        self.assertIsNotNone(jobs.enqueue('record', key='k', n=3))
+
+    def test_failures_back_off_then_give_up(self):
+        job = jobs.enqueue('explode')
+        with self.assertLogs('application.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+        # Not due yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('application.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = jobs.enqueue('record', n=1)
+        self.assertEqual(jobs.claim('dead-worker'), [job])
+        self.assertEqual(jobs.claim('other-worker'), [])
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.LOCK_TIMEOUT * 2)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+
+class WatchlistEnrichmentTests(TestCase):
+
+    detail = {'data': {
+        'mal_id': 5114, 'title': 'Hagane no Renkinjutsushi', 'title_english': 'Fullmetal Alchemist: Brotherhood',
+        'images': {'webp': {'large_image_url': 'https://cdn.example/new.webp'}}, 'status': 'Finished Airing',
+        'score': 9.1, 'episodes': 64,
+    }}
+
+    def setUp(self):
+        self.user = User.objects.create_user('adder')
+        self.client.force_login(self.user)
+
+    def test_card_payload_is_inserted_without_lookup_then_corrected(self):
+        card = {
+            'mal_id': '5114', 'title': 'Fullmetal Alchemist', 'image_url': 'https://cdn.example/old.webp',
+            'score': '8.5', 'status': 'ongoing', 'episodes': '',
+        }
+        with mock.patch('application.jikan.get') as get, mock.patch('application.jikan.aget') as aget:
+            response = self.client.post(reverse('add_to_watchlist'), card)
+            get.assert_not_called()
+            aget.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        entry = Watchlist.objects.get(user=self.user, mal_id=5114)
+        self.assertEqual((entry.title, entry.rating, entry.status, entry.total_episodes), ('Fullmetal Alchemist', 8.5, 'ongoing', 0))
+        self.assertEqual(self.client.post(reverse('add_to_watchlist'), card).status_code, 400)
+
+        with mock.patch('application.jikan.get', return_value=self.detail):
+            jobs.run_pending()
+        entry.refresh_from_db()
+        self.assertEqual(
+            (entry.title, entry.image_url, entry.rating, entry.status, entry.total_episodes),
+            ('Fullmetal Alchemist: Brotherhood', 'https://cdn.example/new.webp', 9.1, 'completed', 64),
+        )
+        self.assertEqual(
+            {field: getattr(WatchlistStats.objects.get(user=self.user), field) for field in ('total', 'completed', 'total_episodes')},
+            {'total': 1, 'completed': 1, 'total_episodes': 64},
+        )
+
+    def test_non_ascii_digits_are_rejected_not_fatal(self):
+        card = {'mal_id': '5114', 'title': 'Fullmetal Alchemist', 'episodes': '\u00b2'}
+        self.assertEqual(self.client.post(reverse('add_to_watchlist'), card).status_code, 201)
+        self.assertEqual(Watchlist.objects.get(user=self.user).total_episodes, 0)
+        for view in ('add_to_watchlist', 'add_to_favorite'):
+            self.assertEqual(self.client.post(reverse(view), {'mal_id': '\u00b2'}).status_code, 400)
+
+    def test_concurrent_favorite_create_is_a_client_error(self):
+        card = {'mal_id': '5114', 'title': 'Fullmetal Alchemist'}
+        self.client.post(reverse('add_to_watchlist'), card)
+        # Another request inserted the entry between the lookup and the insert
+        with mock.patch.object(Watchlist.objects, 'get', side_effect=Watchlist.DoesNotExist):
+            response = self.client.post(reverse('add_to_favorite'), card)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Watchlist.objects.get(user=self.user).is_favorite)
+
+    def test_stale_catalog_row_is_inserted_then_refreshed(self):
+        user = self.user
+        Anime.objects.create(
+            mal_id=5114, title='Hagane no Renkinjutsushi', image_url='old.webp', status='Finished Airing',
+            episodes=0, fetched_at=timezone.now() - timedelta(days=30),
+        )
+        with mock.patch('application.jikan.get') as get:
+            response = self.client.post(reverse('add_to_watchlist'), {'mal_id': '5114'})
+            get.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Job.objects.get().name, 'enrich_watchlist_entry')
+
+        with mock.patch('application.jikan.get', return_value=self.detail):
+            jobs.run_pending()
+        entry = Watchlist.objects.get(user=user, mal_id=5114)
+        self.assertEqual(
+            (entry.title, entry.image_url, entry.total_episodes),
+            ('Fullmetal Alchemist: Brotherhood', 'https://cdn.example/new.webp', 64),
+        )
+
+
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.post = AllPosts.objects.create(user=self.owner, content='hello')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(12)]
+
+    def like(self, user):
+        self.client.force_login(user)
+        self.client.post(reverse('toggle_like', args=[self.post.id]))
+
+    def deliver(self):
+        # Due the delivery jobs now instead of after the coalescing delay
+        Job.objects.update(run_at=timezone.now())
+        jobs.run_pending()
+
+    def test_burst_of_likes_is_one_notification(self):
+        for fan in self.fans:
+            self.like(fan)
+        self.like(self.owner)
+        self.assertEqual(Job.objects.filter(name='deliver_notifications').count(), 1)
+        self.deliver()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.verb, notification.actor_count, notification.actor), ('like', 12, self.fans[-1]))
+        self.client.force_login(self.owner)
+        with self.assertNumQueries(3):
+            # session, user, unread count
+            self.assertEqual(self.client.get(reverse('unread_notifications')).json(), {'unread': 1})
+
+    def test_reading_starts_a_new_notification(self):
+        self.like(self.fans[0])
+        self.deliver()
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('notifications'))
+        self.assertContains(response, 'fan0')
+        self.assertEqual(notifications.unread_count(self.owner), 0)
+
+        self.like(self.fans[1])
+        self.like(self.fans[2])
+        self.deliver()
+        self.assertEqual(
+            list(Notification.objects.order_by('created_at').values_list('actor_count', 'is_read')),
+            [(1, True), (2, False)],
+        )
+        self.assertEqual(notifications.unread_count(self.owner), 1)
+
+    def test_withdrawn_events_remove_unread_notification(self):
+        self.like(self.fans[0])
+        self.deliver()
+        self.like(self.fans[0])
+        self.deliver()
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(notifications.unread_count(self.owner), 0)
+
+    def test_comments_and_follows(self):
+        self.client.force_login(self.fans[0])
+        self.client.post(reverse('add_comment', args=[self.post.id]), {'content': 'nice'})
+        self.client.post(reverse('toggle_follow', args=[self.owner.id]))
+        self.deliver()
+        self.assertEqual(set(Notification.objects.values_list('verb', 'post')), {('comment', self.post.id), ('follow', None)})
+
+
+class RealtimeCountsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer')
+        self.post = AllPosts.objects.create(user=self.user, content='live', likes_count=3)
+        self.broadcaster = realtime.LocalBroadcaster()
+        for patch in (mock.patch.object(realtime, 'broadcaster', self.broadcaster), mock.patch.object(realtime, 'ENABLED', True)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_stream_sends_totals_then_coalesced_changes(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('post_events'), {'ids': str(self.post.id)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+        self.assertIn(b'"likes": 3', await anext(chunks))
+
+        # Published from another thread, as sync views do; the second event replaces the first
+        publishers = [
+            threading.Thread(target=self.broadcaster.publish, args=(realtime.counts_event(self.post.id, likes, 0),))
+            for likes in (4, 5)
+        ]
+        for publisher in publishers:
+            publisher.start()
+            publisher.join()
+        self.assertEqual(
+            await anext(chunks),
+            f'event: counts\ndata: {{"post": {self.post.id}, "likes": 5, "comments": 0}}\n\n'.encode(),
+        )
+        await chunks.aclose()
+
+    def test_like_publishes_to_watchers(self):
+        with mock.patch.object(self.broadcaster, 'publish') as publish:
+            self.client.force_login(self.user)
+            self.client.post(reverse('toggle_like', args=[self.post.id]))
+        publish.assert_called_once_with({'post': self.post.id, 'likes': 4, 'comments': 0})
+
+    def test_nothing_is_published_when_disabled(self):
+        with mock.patch.object(realtime, 'ENABLED', False), mock.patch.object(self.broadcaster, 'publish') as publish:
+            with self.assertNumQueries(0):
+                realtime.publish_post_counts(self.post.id)
+        publish.assert_not_called()
+
+    def test_disabled_stream_tells_client_not_to_reconnect(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(realtime, 'ENABLED', False):
+            self.assertEqual(self.client.get(reverse('post_events'), {'ids': '1'}).status_code, 204)
+        self.assertEqual(self.client.get(reverse('post_events'), {'ids': 'x'}).status_code, 400)
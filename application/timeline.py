@@ -0,0 +1,138 @@
+"""
+Per-user home timelines built from the follow graph.
+
+A new post is written to its author's ``TimelineEntry`` rows along with the
+post itself, and pushed into every follower's (fan-out on write) by a
+background job, so a timeline page is a single range scan on
+``(user, created_at, post)``. Authors with more than ``FANOUT_FOLLOWER_LIMIT``
+followers are only written to their own timeline; their posts are merged in
+when a follower's page is read (fan-out on read), which keeps one post from
+turning into an unbounded number of inserts.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from application import jobs
+from application.models import AllPosts, Follow, TimelineEntry, UserProfile
+
+FANOUT_FOLLOWER_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+# Recent posts copied into a timeline when its owner follows someone new
+BACKFILL_POSTS = 50
+BATCH_SIZE = 1000
+
+
+def followers_count(user_id):
+    return UserProfile.objects.filter(user_id=user_id).values_list('followers_count', flat=True).first() or 0
+
+
+def _write_entries(user_ids, posts):
+    """Insert timeline rows for every user/post pair, in batches, skipping existing ones."""
+    batch, written = [], 0
+    for user_id in user_ids:
+        batch.extend(TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at) for post_id, created_at in posts)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+    return written
+
+
+def fanout_post(post_id):
+    """Write ``post_id`` to its author's followers' timelines, unless the author is too popular."""
+    post = AllPosts.objects.filter(pk=post_id).values_list('user_id', 'created_at').first()
+    if post is None:
+        return 0
+    author_id, created_at = post
+    if followers_count(author_id) > FANOUT_FOLLOWER_LIMIT:
+        return 0
+    followers = Follow.objects.filter(followee_id=author_id).values_list('follower_id', flat=True)
+    return _write_entries(followers.iterator(chunk_size=BATCH_SIZE), [(post_id, created_at)])
+
+
+def publish_post(user, content):
+    """
+    Create a post, put it on its author's timeline and queue the fan-out to
+    their followers, all in one transaction.
+    """
+    with transaction.atomic():
+        post = AllPosts.objects.create(user=user, content=content)
+        TimelineEntry.objects.create(user=user, post=post, created_at=post.created_at)
+        jobs.enqueue('fanout_post', key=f'fanout_post:{post.id}', post_id=post.id)
+    return post
+
+
+def _recent_posts(author_id):
+    return list(
+        AllPosts.objects.filter(user_id=author_id).order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:BACKFILL_POSTS]
+    )
+
+
+def follow(follower, followee):
+    """
+    Make ``follower`` follow ``followee`` and copy the followee's recent posts
+    into the follower's timeline. Returns False if they already followed.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Follow.objects.create(follower=follower, followee=followee)
+        except IntegrityError:
+            return False
+        UserProfile.objects.get_or_create(user=followee)
+        UserProfile.objects.filter(user=followee).update(followers_count=F('followers_count') + 1)
+
+    first_follow = not Follow.objects.filter(follower=follower).exclude(followee=followee).exists()
+    if followers_count(followee.id) <= FANOUT_FOLLOWER_LIMIT:
+        _write_entries([follower.id], _recent_posts(followee.id))
+    if first_follow:
+        # The timeline replaces the global feed from now on; seed it with the user's own posts
+        _write_entries([follower.id], _recent_posts(follower.id))
+    return True
+
+
+def unfollow(follower, followee):
+    """Remove the follow and the followee's posts from the follower's timeline. Returns False if there was none."""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=follower, followee=followee).delete()
+        if not deleted:
+            return False
+        UserProfile.objects.filter(user=followee, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+        TimelineEntry.objects.filter(user=follower, post__user=followee).delete()
+    return True
+
+
+def toggle_follow(follower, followee):
+    """Follow or unfollow and return ``(following, followers_count)``."""
+    following = follow(follower, followee) or not unfollow(follower, followee)
+    return following, followers_count(followee.id)
+
+
+def follows_anyone(user):
+    return Follow.objects.filter(follower=user).exists()
+
+
+def page_post_ids(user, after=None, limit=20):
+    """
+    Return up to ``limit`` post ids for ``user``'s timeline, newest first,
+    starting after the ``(created_at, id)`` keyset position ``after``.
+    """
+    entries = TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post_id')
+    # Followed authors over the fan-out limit are read from their own posts
+    popular = AllPosts.objects.filter(
+        user__in=Follow.objects.filter(
+            follower=user, followee__userprofile__followers_count__gt=FANOUT_FOLLOWER_LIMIT
+        ).values('followee')
+    ).order_by('-created_at', '-id')
+    if after:
+        created_at, post_id = after
+        entries = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id))
+        popular = popular.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id))
+
+    refs = set(entries.values_list('created_at', 'post_id')[:limit])
+    refs.update(popular.values_list('created_at', 'id')[:limit])
+    return [post_id for created_at, post_id in sorted(refs, reverse=True)[:limit]]
@@ -0,0 +1,181 @@
+"""
+In-process trigram index over known anime titles.
+
+Covers every ``Anime`` catalog row (title, English title and synonyms), so
+title lookups and explore searches can be answered without a Jikan round
+trip. Only catalog rows are indexed: they come from Jikan, while watchlist
+titles are whatever users typed or imported and must not change how other
+users' titles resolve. Similarity is the trigram overlap ratio used by
+PostgreSQL's ``pg_trgm``: shared trigrams divided by the trigrams of both
+strings together.
+
+Each worker builds the index in a background thread on first use and then
+picks up new catalog rows incrementally every ``REFRESH_INTERVAL`` seconds.
+Searches never wait for a build; until the first one finishes they find
+nothing and callers fall back to Jikan.
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+from application.models import Anime
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = getattr(settings, 'TITLE_INDEX_REFRESH_INTERVAL', 60)
+# Set False to refresh inline instead (tests, one-off scripts)
+BACKGROUND_REFRESH = getattr(settings, 'TITLE_INDEX_BACKGROUND_REFRESH', True)
+# Minimum similarity for a result to be returned at all
+SEARCH_THRESHOLD = 0.3
+# Minimum similarity to trust a match when resolving a typed title to an anime
+RESOLVE_THRESHOLD = 0.5
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex:
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL, background=BACKGROUND_REFRESH):
+        self.refresh_interval = refresh_interval
+        self.background = background
+        self._lock = threading.Lock()
+        # Guards _refreshing only, so checking it never waits for a build holding _lock
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self.reset()
+
+    def reset(self):
+        # mal_id -> {'title', 'image_url', 'episodes'}
+        self.entries = {}
+        # Parallel lists, one slot per indexed name
+        self.name_ids = []
+        self.name_sizes = []
+        self.postings = {}
+        self.seen_names = set()
+        self.catalog_seen = None
+        self.refreshed = 0
+
+    def add(self, mal_id, names, title, image_url='', episodes=0):
+        self.entries[mal_id] = {'title': title, 'image_url': image_url, 'episodes': episodes}
+        for name in names:
+            normalized = normalize(name)
+            if not normalized or (mal_id, normalized) in self.seen_names:
+                continue
+            self.seen_names.add((mal_id, normalized))
+            grams = trigrams(normalized)
+            slot = len(self.name_ids)
+            self.name_ids.append(mal_id)
+            self.name_sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, array('I')).append(slot)
+
+    def is_due(self):
+        return time.monotonic() - self.refreshed >= self.refresh_interval
+
+    def refresh_soon(self):
+        """Start a refresh in a background thread if one is due and none is running."""
+        if not self.is_due():
+            return
+        if not self.background:
+            self.refresh()
+            return
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Refreshing the title index failed")
+            finally:
+                self._refreshing = False
+                connection.close()
+
+        threading.Thread(target=run, daemon=True, name='title-index-refresh').start()
+
+    def refresh(self, force=False):
+        """Index catalog rows added or refreshed since the last refresh."""
+        if not force and not self.is_due():
+            return
+        with self._lock:
+            if not force and not self.is_due():
+                return
+            catalog = Anime.objects.order_by('fetched_at')
+            if self.catalog_seen is not None:
+                catalog = catalog.filter(fetched_at__gte=self.catalog_seen)
+            rows = catalog.values_list(
+                'mal_id', 'title', 'title_english', 'image_url', 'episodes', 'fetched_at', 'data__title_synonyms'
+            )
+            for mal_id, title, title_english, image_url, episodes, fetched_at, synonyms in rows.iterator(chunk_size=2000):
+                names = [title, title_english, *(synonyms if isinstance(synonyms, list) else [])]
+                self.add(mal_id, names, title_english or title, image_url, episodes)
+                self.catalog_seen = fetched_at
+            self.refreshed = time.monotonic()
+
+    def search(self, query, limit=10, threshold=SEARCH_THRESHOLD):
+        """Return up to ``limit`` ``(mal_id, similarity)`` pairs, best first."""
+        self.refresh_soon()
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+
+        shared = Counter()
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings:
+                shared.update(postings)
+
+        # similarity <= shared / len(grams), so rarer overlaps can be skipped unscored
+        min_shared = threshold * len(grams)
+        best = {}
+        for slot, count in shared.items():
+            if count < min_shared:
+                continue
+            similarity = count / (len(grams) + self.name_sizes[slot] - count)
+            mal_id = self.name_ids[slot]
+            if similarity >= threshold and similarity > best.get(mal_id, 0):
+                best[mal_id] = similarity
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def resolve(self, title, threshold=RESOLVE_THRESHOLD):
+        """Return ``(mal_id, entry)`` for the best match for ``title``, or None."""
+        matches = self.search(title, limit=1, threshold=threshold)
+        if not matches:
+            return None
+        mal_id = matches[0][0]
+        return mal_id, self.entries[mal_id]
+
+
+index = TitleIndex()
+
+
+def search(query, limit=10, threshold=SEARCH_THRESHOLD):
+    return index.search(query, limit, threshold)
+
+
+def resolve(title, threshold=RESOLVE_THRESHOLD):
+    return index.resolve(title, threshold)
@@ -9,14 +9,23 @@ urlpatterns = [
     path('signup', views.signup_view, name='signup'),
     path('check-username/', views.check_username, name='check_username'),
     path('', views.index, name='home'),
+    path('fetch-more-posts', views.fetch_more_posts, name='fetch_more_posts'),
     path('explore', views.explore, name='explore'),
     path('post/<int:post_id>/', views.post_detail, name='post_detail'),
     path('post/<int:post_id>/comment/', views.add_comment, name='add_comment'),
     path('post/<int:post_id>/like/', views.toggle_like, name='toggle_like'),
     path('post/<int:post_id>/delete/', views.delete_post, name='delete_post'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+    path('comment/<int:comment_id>/like/', views.toggle_comment_like, name='toggle_comment_like'),
+    path('user/<int:user_id>/follow/', views.toggle_follow, name='toggle_follow'),
+    path('notifications/', views.notifications_page, name='notifications'),
+    path('notifications/unread/', views.unread_notifications, name='unread_notifications'),
+    path('posts/events/', views.post_events, name='post_events'),
     path('fetch-more-anime', views.fetch_more_anime, name='fetch_more_anime'),
     path('watchlist', views.my_watchlist, name='watchlist'),
+    path('fetch-more-watchlist', views.fetch_more_watchlist, name='fetch_more_watchlist'),
+    path('import-watchlist/', views.import_watchlist, name='import_watchlist'),
+    path('export-watchlist/<str:export_format>/', views.export_watchlist, name='export_watchlist'),
     path('profile', views.profile, name='profile'),
     path('edit-profile', views.edit_profile, name='edit-profile'),
     path('new-post', views.new_post, name='new_post'),
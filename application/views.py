@@ -2,270 +2,314 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, Http404, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Sum, Exists, OuterRef, Count
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.validators import URLValidator
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.template.loader import render_to_string
 from django.utils.timezone import localtime
-from application.models import AllPosts, Watchlist, UserProfile, Comment, PostLike, CommentLike
+from application.models import AllPosts, Anime, Watchlist, UserProfile, Comment, PostLike, CommentLike, Follow, Notification, rating_sort_key
+from application import jikan, jobs, catalog, counters, explore_search, notifications, realtime, stats, timeline, title_index, watchlist_export, watchlist_import
+from application.jikan import JikanError
 from django.contrib import messages
-import requests, re, json, difflib
+import re, json, difflib
+import base64, binascii
+from copy import copy
+from datetime import datetime
 
 
-# Create your views here.
-@login_required(login_url='login')
-def index(request):
-    posts = AllPosts.objects.all().order_by('-created_at')
+FEED_PAGE_SIZE = 20
 
-    if request.user.is_authenticated:
-        # Annotate each post with:
-        # - whether the current user liked it
-        # - number of comments
-        posts = posts.annotate(
-            liked=Exists(
-                PostLike.objects.filter(user=request.user, post=OuterRef("pk"))
-            ),
-            comments_count=Count("comments", distinct=True)  # <-- comment count here
-        )
 
-        user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-        user_name = request.user
+def encode_feed_cursor(post):
+    """Opaque keyset cursor pointing just after ``post`` in the feed ordering."""
+    raw = f"{post.created_at.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_feed_cursor(cursor):
+    """Return ``(created_at, id)`` from a cursor, raising ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, post_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError(f"Invalid feed cursor: {cursor!r}") from exc
+
+
+def feed_page(user, cursor=None, page_size=FEED_PAGE_SIZE):
+    """
+    Fetch one page of the home feed using keyset pagination on (created_at, id).
+
+    Users who follow someone get their precomputed timeline; everyone else
+    sees every post. Returns ``(posts, next_cursor)``; ``next_cursor`` is None
+    on the last page.
+    """
+    posts = AllPosts.objects.select_related('user__userprofile').order_by('-created_at', '-id').annotate(
+        liked=Exists(
+            PostLike.objects.filter(user=user, post=OuterRef("pk"))
+        ),
+        author_followed=Exists(
+            Follow.objects.filter(follower=user, followee=OuterRef("user"))
+        ),
+    )
+    after = decode_feed_cursor(cursor) if cursor else None
+
+    # Fetch one extra row to know whether another page exists
+    if timeline.follows_anyone(user):
+        post_ids = timeline.page_post_ids(user, after, page_size + 1)
+        by_id = posts.in_bulk(post_ids)
+        posts = [by_id[post_id] for post_id in post_ids if post_id in by_id]
     else:
-        user_name = None
-        user_profile = None
+        if after:
+            created_at, post_id = after
+            posts = posts.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id)
+            )
+        posts = list(posts[:page_size + 1])
+
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        return posts, encode_feed_cursor(posts[-1])
+    return posts, None
+
+
+WATCHLIST_PAGE_SIZE = 40
+# sort key -> (column, sort expression, descending); every ordering is
+# tie-broken on id and backed by a (user, expression, id) index, plus
+# status-scoped and favorites-only copies (see Watchlist.Meta.indexes)
+WATCHLIST_SORTS = {
+    'added_at': ('added_at', F('added_at'), True),
+    'title': ('title', F('title'), False),
+    'rating': ('rating', rating_sort_key(), True),
+}
+WATCHLIST_STATUSES = ['plan_to_watch', 'watching', 'completed', 'on_hold', 'dropped']
+
+
+def watchlist_filters(params):
+    """Normalise the ``status``/``favorite``/``sort`` query params, dropping unknown values."""
+    status = params.get('status', '')
+    sort = params.get('sort', '')
+    return {
+        'status': status if status in WATCHLIST_STATUSES else '',
+        'favorite': params.get('favorite') == '1',
+        'sort': sort if sort in WATCHLIST_SORTS else 'added_at',
+    }
+
 
+def encode_watchlist_cursor(entry):
+    """Opaque keyset cursor pointing just after ``entry``, as annotated by ``watchlist_page``."""
+    value = entry.sort_value
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, entry.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_watchlist_cursor(cursor, sort):
+    """Return ``(value, id)`` from a cursor, raising ValueError if it is malformed."""
+    column, expression, descending = WATCHLIST_SORTS[sort]
+    try:
+        value, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if value is None:
+            raise ValueError("missing sort value")
+        return Watchlist._meta.get_field(column).to_python(value), int(entry_id)
+    except (binascii.Error, UnicodeDecodeError, ValidationError, TypeError, ValueError) as exc:
+        raise ValueError(f"Invalid watchlist cursor: {cursor!r}") from exc
+
+
+def filtered_watchlist(user, status='', favorite=False):
+    entries = Watchlist.objects.filter(user=user)
+    if status:
+        entries = entries.filter(status=status)
+    if favorite:
+        entries = entries.filter(is_favorite=True)
+    return entries
+
+
+def watchlist_page(user, status='', favorite=False, sort='added_at', cursor=None, page_size=WATCHLIST_PAGE_SIZE):
+    """
+    Fetch one page of ``user``'s watchlist using keyset pagination on (sort expression, id).
+
+    Unrated anime come last in the rating order. Returns ``(entries,
+    next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    column, expression, descending = WATCHLIST_SORTS[sort]
+    entries = filtered_watchlist(user, status, favorite).annotate(sort_value=expression)
+    if descending:
+        entries = entries.order_by(F('sort_value').desc(), '-id')
+    else:
+        entries = entries.order_by('sort_value', 'id')
+
+    if cursor:
+        value, entry_id = decode_watchlist_cursor(cursor, sort)
+        after = 'lt' if descending else 'gt'
+        entries = entries.filter(Q(**{f'sort_value__{after}': value}) | Q(sort_value=value, **{f'id__{after}': entry_id}))
+
+    # Fetch one extra row to know whether another page exists
+    entries = list(entries[:page_size + 1])
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        return entries, encode_watchlist_cursor(entries[-1])
+    return entries, None
+
+
+# Create your views here.
+@login_required(login_url='login')
+def index(request):
+    posts, next_cursor = feed_page(request.user)
+    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
 
     return render(request, 'home.html', {
         'posts': posts,
-        'has_more_posts': False,
+        'has_more_posts': next_cursor is not None,
+        'next_cursor': next_cursor,
         'user_img': user_profile,
-        'user_name': user_name,
+        'user_name': request.user,
     })
 
 @login_required(login_url='login')
-def explore(request):
+def fetch_more_posts(request):
+    """Return the next page of the home feed as rendered post cards (infinite scroll)."""
+    try:
+        posts, next_cursor = feed_page(request.user, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    html = ''.join(
+        render_to_string('post_card.html', {'post': post}, request=request)
+        for post in posts
+    )
+    return JsonResponse({
+        'html': html,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
+    })
+
+@login_required(login_url='login')
+async def explore(request):
     anime_genres = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi", "Thriller"]
     years = list(range(2025, 1994, -1))
     ratings = ['5.0+', '6.0+', '7.0+', '8.0+', '9.0+']
     statuses = ['Upcoming', 'Ongoing', 'Completed']
 
-    # Genre, rating, status mappings
-    GENRE_MAPPING = {
-        "Action": 1, "Adventure": 2, "Comedy": 4, "Drama": 8,
-        "Fantasy": 10, "Romance": 22, "Sci-Fi": 24, "Thriller": 41
-    }
-    RATING_MAPPING = {
-        "5.0+": 5, "6.0+": 6, "7.0+": 7, "8.0+": 8, "9.0+": 9
-    }
-    STATUS_MAPPING = {
-        "completed": "complete", "upcoming": "upcoming", "ongoing": "airing"
-    }
-    STATUS_COLOR_MAP = {
-        "Finished Airing": {'label': 'completed', 'class': 'bg-green-600'},
-        "Currently Airing": {'label': 'ongoing', 'class': 'bg-blue-600'},
-        "Not yet aired": {'label': 'upcoming', 'class': 'bg-yellow-600'},
-    }
-
-    # Same mappings and lists...
-    search_title = request.GET.get('search', '')
-    genre = request.GET.get('genre', '')
-    year = request.GET.get('year', '')
-    rating = request.GET.get('rating', '')
-    status = request.GET.get('status', '')
-    sort_by = request.GET.get('sort', 'popularity')
+    filters = explore_search.filters_from_query(request.GET)
     active_filters = [(field, request.GET.get(field)) for field in ['genre', 'year', 'rating', 'status'] if request.GET.get(field)]
-    params = {}
-    if sort_by == 'popularity':
-        params['order_by'] = 'members'
-        params['sort'] = 'desc'
-    elif sort_by == 'rating':
-        params['order_by'] = 'score'
-        params['sort'] = 'desc'
-    elif sort_by == 'year':
-        params['order_by'] = 'start_date'
-        params['sort'] = 'desc'
-    elif sort_by == 'title':
-        params['order_by'] = 'title'
-        params['sort'] = 'asc'
-
-    if search_title:
-        params['q'] = search_title
-    if genre and genre.title() in GENRE_MAPPING:
-        params['genres'] = GENRE_MAPPING[genre.title()]
-    if year:
-        params['start_date'] = f"{year}-01-01"
-        params['end_date'] = f"{year}-12-31"
-    if rating and rating in RATING_MAPPING:
-        params['min_score'] = RATING_MAPPING[rating]
-    if status and status.lower() in STATUS_MAPPING:
-        params['status'] = STATUS_MAPPING[status.lower()]
-
-    if params:
-        params['sfw'] = 'true'
-        response = requests.get("https://api.jikan.moe/v4/anime", params=params)
-        if response.status_code == 200:
-            raw_anime = response.json().get('data', [])
-            unique_anime_map = {}
-            for anime in raw_anime:
-                mal_id = anime.get('mal_id')
-                if mal_id and mal_id not in unique_anime_map:
-                    unique_anime_map[mal_id] = anime
-            anime_data = list(unique_anime_map.values())[:24]
-        else:
-            anime_data = []
-
-        pagination_info = response.json().get('pagination', {})
-    else:
-        response = requests.get("https://api.jikan.moe/v4/top/anime", params={'sfw': 'true'})
-        if response.status_code == 200:
-            raw_anime = response.json().get('data', [])
-            unique_anime_map = {}
-            for anime in raw_anime:
-                mal_id = anime.get('mal_id')
-                if mal_id and mal_id not in unique_anime_map:
-                    unique_anime_map[mal_id] = anime
-            anime_data = list(unique_anime_map.values())[:24]
-        else:
-            anime_data = []
-        pagination_info = response.json().get('pagination', {})
-
-    # Get user watchlist and favorites
-    user_watchlist = Watchlist.objects.filter(user=request.user)
-    watchlist_ids = set(user_watchlist.values_list('mal_id', flat=True))
-    fav_ids = set(user_watchlist.filter(is_favorite=True).values_list('mal_id', flat=True))
-
-    for anime in anime_data:
-        status = anime.get('status', 'unknown')
-        anime['status_color'] = STATUS_COLOR_MAP.get(status, {'label': 'unknown', 'class': 'bg-gray-500'})
-        anime['is_in_watchlist'] = int(anime['mal_id']) in watchlist_ids
-        anime['is_favorite'] = int(anime['mal_id']) in fav_ids
-
-    total_animes = pagination_info.get('items', {}).get('total', 0)
+    result = await explore_search.asearch(await request.auser(), filters)
+    pagination_info = result['pagination']
 
     context = {
-        'search_title': search_title,
-        'anime_list': anime_data,
-        'total_results': total_animes,
+        'search_title': filters['search'],
+        'anime_list': result['anime'],
+        'total_results': pagination_info.get('items', {}).get('total', 0),
         'genres': anime_genres,
-        'sort_by': sort_by,
+        'sort_by': filters['sort'] or explore_search.DEFAULT_SORT,
         'years': years,
         'ratings': ratings,
         'statuses': statuses,
         'active_filters': active_filters,
-        'has_next_page': pagination_info.get('has_next_page', False),
-        'next_api_page': pagination_info.get('current_page', 1) + 1 if pagination_info.get('has_next_page') else None,
+        'has_next_page': result['next_page'] is not None,
+        'next_api_page': result['next_page'],
     }
 
     return render(request, 'explore.html', context)
 
 
 @login_required(login_url='login')
-def fetch_more_anime(request):
-    page = request.GET.get('page')
-    search = request.GET.get("search")
-    genre = request.GET.get("genre")
-    year = request.GET.get("year")
-    rating = request.GET.get("rating")
-    status = request.GET.get("status")
-    params = {'page': page,'sfw': 'true'}
-    # Genre, rating, status mappings
-    GENRE_MAPPING = {
-        "Action": 1, "Adventure": 2, "Comedy": 4, "Drama": 8,
-        "Fantasy": 10, "Romance": 22, "Sci-Fi": 24, "Thriller": 41
-    }
-    RATING_MAPPING = {
-        "5.0+": 5, "6.0+": 6, "7.0+": 7, "8.0+": 8, "9.0+": 9
-    }
-    STATUS_MAPPING = {
-        "completed": "complete", "upcoming": "upcoming", "ongoing": "airing"
-    }
+async def fetch_more_anime(request):
+    page = explore_search.parse_page(request.GET.get('page'))
+    result = await explore_search.asearch(
+        await request.auser(), explore_search.filters_from_query(request.GET), page
+    )
+    return JsonResponse({
+        'anime': result['anime'],
+        'has_next': result['next_page'] is not None,
+        'next_api_page': result['next_page'],
+    })
 
-    sort_by = request.GET.get('sort', 'popularity')
-
-    if sort_by == 'popularity':
-        params['order_by'] = 'members'
-        params['sort'] = 'desc'
-    elif sort_by == 'rating':
-        params['order_by'] = 'score'
-        params['sort'] = 'desc'
-    elif sort_by == 'year':
-        params['order_by'] = 'start_date'
-        params['sort'] = 'desc'
-    elif sort_by == 'title':
-        params['order_by'] = 'title'
-        params['sort'] = 'asc'
-
-    if search:
-        params['q'] = search
-    if genre and genre.title() in GENRE_MAPPING:
-        params['genres'] = GENRE_MAPPING[genre.title()]
-    if year:
-        params['start_date'] = f"{year}-01-01"
-        params['end_date'] = f"{year}-12-31"
-    if rating and rating in RATING_MAPPING:
-        params['min_score'] = RATING_MAPPING[rating]
-    if status and status.lower() in STATUS_MAPPING:
-        params['status'] = STATUS_MAPPING[status.lower()]
-
-    # selecting correct url for sending request
-    if search or genre or year or rating or status:
-        response = requests.get("https://api.jikan.moe/v4/anime", params=params)
+
+
+@login_required(login_url='login')
+def my_watchlist(request):
+    filters = watchlist_filters(request.GET)
+    entries, next_cursor = watchlist_page(request.user, **filters)
+    if filters['status'] or filters['favorite']:
+        length_of_watchlist = filtered_watchlist(request.user, filters['status'], filters['favorite']).count()
     else:
-        response = requests.get("https://api.jikan.moe/v4/top/anime", params=params)
-    data = response.json().get('data', []) if response.status_code == 200 else []
-    user_watchlist = Watchlist.objects.filter(user=request.user)
-    watchlist_ids = set(user_watchlist.values_list('mal_id', flat=True))
-    fav_ids = set(user_watchlist.filter(is_favorite=True).values_list('mal_id', flat=True))
-    STATUS_COLOR_MAP = {
-        "Finished Airing": {'label': 'completed', 'class': 'bg-green-600'},
-        "Currently Airing": {'label': 'ongoing', 'class': 'bg-blue-600'},
-        "Not yet aired": {'label': 'upcoming', 'class': 'bg-yellow-600'},
-    }
-    for anime in data:
-        status = anime.get('status', 'unknown')
-        anime['status_color'] = STATUS_COLOR_MAP.get(status, {'label': 'unknown', 'class': 'bg-gray-500'})
-        anime['is_in_watchlist'] = int(anime['mal_id']) in watchlist_ids
-        anime['is_favorite'] = int(anime['mal_id']) in fav_ids
+        length_of_watchlist = stats.get_watchlist_stats(request.user).total
+    return render(request, 'watchlist.html', {
+        'watchlist': entries,
+        'watchlist_length': length_of_watchlist,
+        'filters': filters,
+        'has_more_entries': next_cursor is not None,
+        'next_cursor': next_cursor,
+    })
 
-    # Assume Jikan API returns pagination info like total pages or next_page
-    pagination_info = response.json().get('pagination', {})
-    has_next = pagination_info.get('has_next_page', False)
-    next_api_page = int(page) + 1 if has_next else None
+@login_required(login_url='login')
+def fetch_more_watchlist(request):
+    """Return the next page of the watchlist as rendered anime cards (incremental loading)."""
+    try:
+        entries, next_cursor = watchlist_page(
+            request.user, cursor=request.GET.get('cursor'), **watchlist_filters(request.GET)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
+    html = ''.join(
+        render_to_string('watchlist_card.html', {'anime': entry}, request=request)
+        for entry in entries
+    )
     return JsonResponse({
-        'anime': data,
-        'has_next': has_next,
-        'next_api_page': next_api_page
+        'html': html,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
     })
 
-
+@login_required(login_url='login')
+@require_POST
+def import_watchlist(request):
+    """Import an uploaded MyAnimeList/AniList export into the user's watchlist."""
+    export = request.FILES.get('file')
+    if not export:
+        return JsonResponse({'success': False, 'error': 'Choose an export file to import'}, status=400)
+    try:
+        imported, skipped = watchlist_import.import_watchlist(request.user, export.file)
+    except watchlist_import.ImportFormatError as exc:
+        return JsonResponse({'success': False, 'error': str(exc)}, status=400)
+    return JsonResponse({'success': True, 'imported': imported, 'skipped': skipped})
 
 @login_required(login_url='login')
-def my_watchlist(request):
-    user_watchlist = Watchlist.objects.filter(user=request.user)
-    length_of_watchlist = len(user_watchlist)
-    return render(request, 'watchlist.html', {'watchlist': user_watchlist,'watchlist_length': length_of_watchlist})
+def export_watchlist(request, export_format):
+    """Stream the user's whole watchlist as CSV, JSON Lines or MyAnimeList XML."""
+    if export_format not in watchlist_export.EXPORTERS:
+        raise Http404("Unknown export format")
+    content_type, extension = watchlist_export.EXPORTERS[export_format][3:]
+    # Under ASGI a sync iterator would be read into memory in full before sending
+    exporter = watchlist_export.aexport if isinstance(request, ASGIRequest) else watchlist_export.export
+    response = StreamingHttpResponse(exporter(request.user, export_format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="watchlist.{extension}"'
+    return response
 
 @login_required(login_url='login')
 def profile(request):
     user = request.user
     user_profile, created = UserProfile.objects.get_or_create(user=request.user)
-    user_watchlist = Watchlist.objects.filter(user=request.user)
-    completed_animes = Watchlist.objects.filter(user=request.user,status='completed')
-    plan_to_watch_animes = Watchlist.objects.filter(user=request.user,status='plan_to_watch')
-    watching_animes = Watchlist.objects.filter(user=request.user,status='watching')
-    dropped_animes = Watchlist.objects.filter(user=request.user,status='dropped')
-    total_episodes = Watchlist.objects.filter(user=request.user, status='completed').aggregate(total=Sum('total_episodes'))['total'] or 0
+    user_stats = stats.get_watchlist_stats(user)
     favorite_animes = Watchlist.objects.filter(user=request.user, is_favorite=True)
     return render(request, "profile.html", {
         "user": user,
         "user_profile": user_profile,
-        "length_of_watchlist": len(user_watchlist),
-        "completed_animes": len(completed_animes),
-        "watching_animes": len(watching_animes),
-        "plan_to_watch_animes": len(plan_to_watch_animes),
-        "dropped_animes": len(dropped_animes),
-        "total_episodes":total_episodes,
+        "length_of_watchlist": user_stats.total,
+        "completed_animes": user_stats.completed,
+        "watching_animes": user_stats.watching,
+        "plan_to_watch_animes": user_stats.plan_to_watch,
+        "dropped_animes": user_stats.dropped,
+        "total_episodes": user_stats.total_episodes,
         "favorite_anime": favorite_animes
     })
 
@@ -274,19 +318,20 @@ def profile(request):
 def new_post(request):
     post_content = request.POST.get('content')
     if post_content:
-        AllPosts.objects.create(user=request.user,content=post_content)
+        timeline.publish_post(request.user, post_content)
     return redirect('home')
 
 @login_required(login_url='login')
-def anime_details(request, anime_id):
-    anime_detail = requests.get(f'https://api.jikan.moe/v4/anime/{anime_id}').json()
-    anime_characters = requests.get(f'https://api.jikan.moe/v4/anime/{anime_id}/characters').json()
-    is_added = Watchlist.objects.filter(mal_id=anime_id).first()
-    is_fav = Watchlist.objects.filter(mal_id=anime_id, is_favorite=True).first()
-    data = anime_detail.get('data', [])
-    trailer_url = data['trailer']['url']
-    print(trailer_url)
-    return render(request, 'anime_details.html', {'anime':anime_detail['data'], 'trailer_url': trailer_url, 'anime_characters':anime_characters['data'][:10], 'is_added':is_added,"is_fav": is_fav, "malId": anime_id })
+async def anime_details(request, anime_id):
+    try:
+        anime = await catalog.aget_anime(anime_id, with_characters=True)
+    except JikanError as exc:
+        if exc.status_code == 404:
+            raise Http404("Anime not found")
+        raise
+    is_added = await Watchlist.objects.filter(user=await request.auser(), mal_id=anime_id).afirst()
+    is_fav = is_added if is_added and is_added.is_favorite else None
+    return render(request, 'anime_details.html', {'anime': anime.data, 'trailer_url': anime.trailer_url, 'anime_characters': anime.characters, 'is_added': is_added, "is_fav": is_fav, "malId": anime_id})
 
 def login_view(request):
     if request.user.is_authenticated:
@@ -367,47 +412,105 @@ def check_username(request):
     exists = not User.objects.filter(username=username).exists()
     return JsonResponse({'available': exists})
 
+
+CARD_STATUSES = {color['label'] for color in catalog.STATUS_COLOR_MAP.values()} | {catalog.UNKNOWN_STATUS['label']}
+validate_image_url = URLValidator(schemes=['http', 'https'])
+
+
+def card_watchlist_fields(data):
+    """
+    Watchlist columns from the anime card fields the explore page posts along
+    with ``mal_id``, or None if the request didn't include them. Values are
+    only sanity-checked here; the enrichment job replaces them with catalog data.
+    """
+    title = data.get('title', '').strip()[:255]
+    if not title:
+        return None
+    image_url = data.get('image_url', '')
+    try:
+        validate_image_url(image_url)
+    except ValidationError:
+        image_url = ''
+    try:
+        rating = float(data.get('score', ''))
+        if not 0 <= rating <= 10:
+            rating = None
+    except ValueError:
+        rating = None
+    try:
+        episodes = max(int(data.get('episodes', '')), 0)
+    except ValueError:
+        episodes = 0
+    status = data.get('status', '')
+    return {
+        'title': title,
+        'image_url': image_url,
+        'status': status if status in CARD_STATUSES else catalog.UNKNOWN_STATUS['label'],
+        'rating': rating,
+        'total_episodes': episodes,
+    }
+
+
+def catalog_watchlist_fields(anime):
+    return {
+        'title': anime.display_title,
+        'image_url': anime.image_url,
+        'status': catalog.status_color(anime.status)['label'],
+        'rating': anime.score,
+        'total_episodes': anime.episodes,
+    }
+
+
+def add_watchlist_entry(user, mal_id, fields, enrich, **extra):
+    """
+    Insert a watchlist entry and, when ``enrich`` is set, queue a job that
+    corrects its catalog fields. Raises IntegrityError if it already exists.
+    """
+    with transaction.atomic():
+        entry = stats.create_watchlist_entry(user=user, mal_id=mal_id, **fields, **extra)
+        if enrich:
+            jobs.enqueue(
+                'enrich_watchlist_entry',
+                key=f'enrich_watchlist_entry:{user.id}:{mal_id}',
+                user_id=user.id,
+                mal_id=mal_id,
+                submitted={'status': entry.status, 'rating': entry.rating},
+            )
+    return entry
+
+
 @require_POST
 @login_required(login_url='login')
-def add_to_watchlist(request):
+async def add_to_watchlist(request):
     mal_id = request.POST.get('mal_id')
+    user = await request.auser()
 
     # Validate mal_id
-    if not mal_id or not mal_id.isdigit():
+    if not mal_id or not mal_id.isdecimal():
         return JsonResponse({'message': 'Invalid MAL ID'}, status=400)
-
-    # Check if already exists
-    if Watchlist.objects.filter(user=request.user, mal_id=mal_id).exists():
-        return JsonResponse({'message': 'Already added'}, status=400)
+    mal_id = int(mal_id)
+
+    # Explore cards send what they show, so the entry can be saved without a lookup
+    fields = card_watchlist_fields(request.POST)
+    enrich = True
+    if fields is None:
+        if await Watchlist.objects.filter(user=user, mal_id=mal_id).aexists():
+            return JsonResponse({'message': 'Already added'}, status=400)
+        # A stale catalog row is good enough to insert now; a job refreshes it afterwards
+        anime = await Anime.objects.filter(mal_id=mal_id).afirst()
+        if anime is None:
+            try:
+                # Nothing local yet, so fetch from Jikan once
+                anime = await catalog.aget_anime(mal_id)
+            except (JikanError, KeyError):
+                return JsonResponse({'message': 'Failed to fetch anime data'}, status=500)
+        fields = catalog_watchlist_fields(anime)
+        enrich = catalog.is_stale(anime.fetched_at)
 
     try:
-        # Fetch anime data
-        response = requests.get(f'https://api.jikan.moe/v4/anime/{mal_id}')
-        response.raise_for_status()
-        anime_data = response.json().get('data')
-    except (requests.RequestException, KeyError):
-        return JsonResponse({'message': 'Failed to fetch anime data'}, status=500)
-
-    # Status mapping
-    status_map = {
-        "Finished Airing": {'label': 'completed', 'class': 'bg-green-600'},
-        "Currently Airing": {'label': 'ongoing', 'class': 'bg-blue-600'},
-        "Not yet aired": {'label': 'upcoming', 'class': 'bg-yellow-600'},
-    }
-    status = anime_data.get('status', 'unknown')
-    anime_data['status_color'] = status_map.get(status, {'label': 'unknown', 'class': 'bg-gray-500'})
-
-    episodes = anime_data.get('episodes') or 0
-    # Save to DB
-    Watchlist.objects.create(
-        user=request.user,
-        mal_id=mal_id,
-        title=anime_data.get('title_english') or anime_data.get('title'),
-        image_url=anime_data.get('images', {}).get('webp', {}).get('large_image_url'),
-        status=anime_data['status_color']['label'],
-        rating=anime_data.get('score'),
-        total_episodes = episodes
-    )
+        await sync_to_async(add_watchlist_entry)(user, mal_id, fields, enrich)
+    except IntegrityError:
+        return JsonResponse({'message': 'Already added'}, status=400)
 
     return JsonResponse({'message': 'Anime added to watchlist ✅'}, status=201)
 
@@ -416,46 +519,41 @@ def add_to_watchlist(request):
 def toggle_favorite(request):
     mal_id = request.POST.get('mal_id')
 
-    if not mal_id or not mal_id.isdigit():
+    if not mal_id or not mal_id.isdecimal():
         return JsonResponse({'error': 'Invalid MAL ID'}, status=400)
+    mal_id = int(mal_id)
 
     try:
         # Try to get the anime from the user's watchlist
         anime = Watchlist.objects.get(user=request.user, mal_id=mal_id)
 
     except Watchlist.DoesNotExist:
-        # If not in watchlist, fetch from API and create it with is_favorite=True
+        # If not in watchlist, create it with is_favorite=True from the card or the catalog
+        fields = card_watchlist_fields(request.POST)
+        enrich = True
+        if fields is None:
+            catalog_anime = Anime.objects.filter(mal_id=mal_id).first()
+            if catalog_anime is None:
+                try:
+                    catalog_anime = catalog.get_anime(mal_id)
+                except (JikanError, KeyError):
+                    return JsonResponse({'error': 'Failed to fetch anime data'}, status=500)
+            fields = catalog_watchlist_fields(catalog_anime)
+            enrich = catalog.is_stale(catalog_anime.fetched_at)
+
         try:
-            response = requests.get(f'https://api.jikan.moe/v4/anime/{mal_id}')
-            response.raise_for_status()
-            anime_data = response.json().get('data')
-        except (requests.RequestException, KeyError):
-            return JsonResponse({'error': 'Failed to fetch anime data'}, status=500)
-
-        # Status mapping
-        status_map = {
-            "Finished Airing": {'label': 'completed', 'class': 'bg-green-600'},
-            "Currently Airing": {'label': 'ongoing', 'class': 'bg-blue-600'},
-            "Not yet aired": {'label': 'upcoming', 'class': 'bg-yellow-600'},
-        }
-        status = anime_data.get('status', 'unknown')
-        status_color = status_map.get(status, {'label': 'unknown', 'class': 'bg-gray-500'})
-
-        # Create new Watchlist entry with is_favorite=True
-        anime = Watchlist.objects.create(
-            user=request.user,
-            mal_id=mal_id,
-            title=anime_data.get('title_english') or anime_data.get('title'),
-            image_url=anime_data.get('images', {}).get('webp', {}).get('large_image_url'),
-            status=status_color['label'],
-            rating=anime_data.get('score'),
-            is_favorite=True
-        )
+            add_watchlist_entry(request.user, mal_id, fields, enrich, is_favorite=True)
+        except IntegrityError:
+            # Added by a concurrent request since the lookup above
+            return JsonResponse({'error': 'Already added'}, status=400)
         return JsonResponse({'favorited': True, 'message': 'Anime added to watchlist and marked as favorite'})
 
     # If already in watchlist, toggle favorite
+    before = copy(anime)
     anime.is_favorite = not anime.is_favorite
-    anime.save()
+    with transaction.atomic():
+        anime.save(update_fields=['is_favorite'])
+        stats.record_watchlist_change(request.user.id, before, anime)
     return JsonResponse({'favorited': anime.is_favorite})
 
 @csrf_exempt
@@ -465,7 +563,9 @@ def delete_anime(request, anime_id):
     if request.method == "POST":
         try:
             anime = Watchlist.objects.get(user=request.user, mal_id=anime_id)
-            anime.delete()
+            with transaction.atomic():
+                anime.delete()
+                stats.record_watchlist_change(request.user.id, anime, None)
             return JsonResponse({'success': True})
         except Watchlist.DoesNotExist:
             return JsonResponse({'error': 'Anime not found'}, status=404)
@@ -502,29 +602,33 @@ def add_or_update_anime(request):
                             "title": title
                         })
 
-                    # Jikan API Search
-                    jikan_url = f'https://api.jikan.moe/v4/anime?q={title}&type=tv&limit=5'
-                    response = requests.get(jikan_url)
-
-                    if response.status_code != 200:
-                        return JsonResponse({'success': False, 'error': 'Failed to retrieve anime.'}, status=500)
-
-                    results = response.json().get('data', [])
-
-                    if not results:
-                        return JsonResponse({'success': False, 'error': 'No matching anime found'}, status=404)
-
-                    # Find best match
-                    best_match = max(
-                        results,
-                        key=lambda anime: difflib.SequenceMatcher(
-                            None, title.lower(), (anime.get('title_english') or anime.get('title')).lower()
-                        ).ratio()
-                    )
-                    title = best_match.get('title_english') or best_match.get('title')
-                    mal_id = best_match.get('mal_id')
-                    image_url = best_match['images']['webp']['large_image_url']
-                    episodes = best_match.get('episodes') or 0
+                    # Resolve against the local title index first, Jikan only on a miss
+                    local_match = title_index.resolve(title)
+                    if local_match:
+                        mal_id, match = local_match
+                        title = match['title']
+                        image_url = match['image_url']
+                        episodes = match['episodes']
+                    else:
+                        try:
+                            results = jikan.get('anime', params={'q': title, 'type': 'tv', 'limit': 5}).get('data', [])
+                        except JikanError:
+                            return JsonResponse({'success': False, 'error': 'Failed to retrieve anime.'}, status=500)
+
+                        if not results:
+                            return JsonResponse({'success': False, 'error': 'No matching anime found'}, status=404)
+
+                        # Find best match
+                        best_match = max(
+                            results,
+                            key=lambda anime: difflib.SequenceMatcher(
+                                None, title.lower(), (anime.get('title_english') or anime.get('title')).lower()
+                            ).ratio()
+                        )
+                        title = best_match.get('title_english') or best_match.get('title')
+                        mal_id = best_match.get('mal_id')
+                        image_url = best_match['images']['webp']['large_image_url']
+                        episodes = best_match.get('episodes') or 0
 
             # Update or Add Anime
             defaults = {
@@ -538,11 +642,14 @@ def add_or_update_anime(request):
             if episodes:
                 defaults['total_episodes'] = episodes
 
-            watchlist_item, created = Watchlist.objects.update_or_create(
-                user=request.user,
-                mal_id=mal_id,
-                defaults=defaults
-            )
+            with transaction.atomic():
+                before = Watchlist.objects.select_for_update().filter(user=request.user, mal_id=mal_id).first()
+                watchlist_item, created = Watchlist.objects.update_or_create(
+                    user=request.user,
+                    mal_id=mal_id,
+                    defaults=defaults
+                )
+                stats.record_watchlist_change(request.user.id, before, watchlist_item)
 
             return JsonResponse({
                 'success': True,
@@ -607,26 +714,22 @@ def delete_post(request, post_id):
 @login_required
 def post_detail(request, post_id):
     """Display a single post with its comments."""
-    post = get_object_or_404(AllPosts, id=post_id)
-
-    # Check if current user has liked the post
-    user_has_liked = False
-    if request.user.is_authenticated:
-        user_has_liked = PostLike.objects.filter(user=request.user, post=post).exists()
-    # Get profile picture from DB if user has one
-    user_img = None
-    user_name = None
-    if request.user.is_authenticated:
-        user_name = request.user.username
-        profile = UserProfile.objects.get(user=request.user)  # fetch from DB
-        user_img = profile.profile_picture  # actual image URL from DB
-    # Get all comments for this post, ordered by newest first
-    # comments = post.comments.all().order_by('-created_at')
+    # Authors' profiles are joined in so avatar_url never triggers extra queries
+    comments = Comment.objects.select_related('user__userprofile').annotate(
+        liked=Exists(CommentLike.objects.filter(user=request.user, comment=OuterRef("pk")))
+    )
+    post = get_object_or_404(
+        AllPosts.objects.select_related('user__userprofile').annotate(
+            liked=Exists(PostLike.objects.filter(user=request.user, post=OuterRef("pk")))
+        ).prefetch_related(Prefetch('comments', queryset=comments)),
+        id=post_id
+    )
+    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
     context = {
         'post': post,
-        'user_has_liked': user_has_liked,
-        'user_img': user_img,
-        'user_name': user_name,
+        'user_has_liked': post.liked,
+        'user_img': user_profile,
+        'user_name': request.user.username,
     }
 
     return render(request, 'post_detail.html', context)
@@ -640,15 +743,17 @@ def add_comment(request, post_id):
     content = request.POST.get('content', '').strip()
 
     if content and len(content) <= 280:
-        comment = Comment.objects.create(
-            post=post,
-            user=request.user,
-            content=content
-        )
-        # Optional: Add notification to post owner
-        if post.user != request.user:
-            # Create notification logic here
-            pass
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                post=post,
+                user=request.user,
+                content=content
+            )
+            counters.adjust_comments_count(post.id, 1)
+            counters.schedule_reconcile(post.id)
+            if post.user != request.user:
+                notifications.schedule(Notification.COMMENT, post.id)
+        realtime.publish_post_counts(post.id)
 
     return redirect('post_detail', post_id=post_id)
 
@@ -658,11 +763,17 @@ def add_comment(request, post_id):
 def delete_comment(request, comment_id):
     """Delete a comment if user is the owner."""
     comment = get_object_or_404(Comment, id=comment_id)
-    post_id = comment.post.id
+    post_id = comment.post_id
 
     # Only allow comment owner to delete
     if comment.user == request.user:
-        comment.delete()
+        with transaction.atomic():
+            comment.delete()
+            counters.adjust_comments_count(post_id, -1)
+            counters.schedule_reconcile(post_id)
+            # Recount any unread notification that included this comment
+            notifications.schedule(Notification.COMMENT, post_id)
+        realtime.publish_post_counts(post_id)
 
     return redirect('post_detail', post_id=post_id)
 
@@ -671,29 +782,79 @@ def delete_comment(request, comment_id):
 @require_POST
 def toggle_like(request, post_id):
     """Toggle like status for a post (AJAX endpoint)."""
-    post = get_object_or_404(AllPosts, id=post_id)
+    try:
+        liked, likes_count = counters.toggle_like(PostLike, AllPosts, 'post', post_id, request.user)
+    except AllPosts.DoesNotExist:
+        raise Http404("Post not found")
+    notifications.schedule(Notification.LIKE, post_id)
+    realtime.publish_post_counts(post_id)
 
-    # Check if user already liked the post
-    like = PostLike.objects.filter(user=request.user, post=post).first()
+    return JsonResponse({
+        "liked": liked,
+        "likes_count": likes_count
+    })
 
-    if like:
-        # Unlike the post
-        like.delete()
-        post.likes_count = PostLike.objects.filter(post=post).count()
-        post.save(update_fields=["likes_count"])
-        liked = False
-    else:
-        # Like the post
-        PostLike.objects.create(user=request.user, post=post)  # ✅ use PostLike
-        post.likes_count = PostLike.objects.filter(post=post).count()
-        post.save(update_fields=["likes_count"])
-        liked = True
 
-    # Get updated like count
-    likes_count = post.likes.count()
+@login_required
+@require_POST
+def toggle_follow(request, user_id):
+    """Follow or unfollow a user (AJAX endpoint)."""
+    followee = get_object_or_404(User, pk=user_id)
+    if followee == request.user:
+        return JsonResponse({"error": "You can't follow yourself"}, status=400)
+    following, followers_count = timeline.toggle_follow(request.user, followee)
+    notifications.schedule(Notification.FOLLOW, followee.id)
+
+    return JsonResponse({
+        "following": following,
+        "followers_count": followers_count
+    })
+
+
+@login_required
+@require_POST
+def toggle_comment_like(request, comment_id):
+    """Toggle like status for a comment (AJAX endpoint)."""
+    try:
+        liked, likes_count = counters.toggle_like(CommentLike, Comment, 'comment', comment_id, request.user)
+    except Comment.DoesNotExist:
+        raise Http404("Comment not found")
 
     return JsonResponse({
         "liked": liked,
-        "likes_count": post.likes_count
+        "likes_count": likes_count
     })
 
+
+@login_required(login_url='login')
+def notifications_page(request):
+    """Recent notifications, newest first; opening the page marks them read."""
+    items = notifications.recent(request.user)
+    notifications.mark_all_read(request.user)
+    return render(request, 'notifications.html', {'notifications': items})
+
+
+@login_required
+def unread_notifications(request):
+    """Unread notification count for the navbar badge (polled)."""
+    return JsonResponse({'unread': notifications.unread_count(request.user)})
+
+
+@login_required(login_url='login')
+async def post_events(request):
+    """Server-Sent Events with live like/comment counts for the posts in ``?ids=`` (see realtime.py)."""
+    if not realtime.ENABLED:
+        # Tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    try:
+        post_ids = {int(post_id) for post_id in request.GET.get('ids', '').split(',') if post_id}
+    except ValueError:
+        return JsonResponse({'error': 'Invalid post ids'}, status=400)
+    if not post_ids or len(post_ids) > realtime.MAX_POSTS:
+        return JsonResponse({'error': f'Watch between 1 and {realtime.MAX_POSTS} posts'}, status=400)
+
+    response = StreamingHttpResponse(realtime.stream(post_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,106 @@
+"""
+Streaming watchlist export as CSV, JSON Lines or MyAnimeList-compatible XML.
+
+Rows are read with ``.iterator()`` (``.aiterator()`` under ASGI) and turned
+into text one at a time, so an export holds a single chunk of rows in memory
+however long the list is, and the response starts flowing before the last
+row is read. The XML output can be imported back by MyAnimeList or by
+``watchlist_import``.
+
+Each format is a ``(head, line, tail)`` triple shared by ``export`` and
+``aexport``. The ASGI handler would read a sync iterator into a list before
+sending it, so async servers need ``aexport``.
+"""
+import csv
+import json
+from xml.sax.saxutils import escape
+
+from application.models import Watchlist
+
+CHUNK_SIZE = 1000
+FIELDS = ['mal_id', 'title', 'status', 'rating', 'is_favorite', 'total_episodes', 'added_at', 'image_url']
+
+MAL_STATUS_LABELS = {
+    'watching': 'Watching', 'completed': 'Completed', 'on_hold': 'On-Hold',
+    'dropped': 'Dropped', 'plan_to_watch': 'Plan to Watch',
+}
+
+
+def _rows(user):
+    return Watchlist.objects.filter(user=user).order_by('id').values(*FIELDS)
+
+
+class _Echo:
+    """File-like object whose ``write`` hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+_csv_writer = csv.writer(_Echo())
+
+
+def csv_head(user):
+    return _csv_writer.writerow(FIELDS)
+
+
+def csv_line(row):
+    row['added_at'] = row['added_at'].isoformat()
+    return _csv_writer.writerow([row[field] for field in FIELDS])
+
+
+def jsonl_line(row):
+    row['added_at'] = row['added_at'].isoformat()
+    return json.dumps(row) + '\n'
+
+
+def mal_xml_head(user):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n<myanimelist>\n'
+        f'  <myinfo>\n    <user_name>{escape(user.username)}</user_name>\n'
+        '    <user_export_type>1</user_export_type>\n  </myinfo>\n'
+    )
+
+
+def mal_xml_line(row):
+    episodes = row['total_episodes'] or 0
+    watched = episodes if row['status'] == 'completed' else 0
+    return (
+        '  <anime>\n'
+        f'    <series_animedb_id>{row["mal_id"]}</series_animedb_id>\n'
+        f'    <series_title>{escape(row["title"])}</series_title>\n'
+        f'    <series_episodes>{episodes}</series_episodes>\n'
+        f'    <my_watched_episodes>{watched}</my_watched_episodes>\n'
+        f'    <my_score>{round(row["rating"] or 0)}</my_score>\n'
+        f'    <my_status>{MAL_STATUS_LABELS.get(row["status"], "Plan to Watch")}</my_status>\n'
+        '    <update_on_import>1</update_on_import>\n'
+        '  </anime>\n'
+    )
+
+
+# format -> (head, line, tail, content type, file extension)
+EXPORTERS = {
+    'csv': (csv_head, csv_line, '', 'text/csv', 'csv'),
+    'jsonl': (None, jsonl_line, '', 'application/x-ndjson', 'jsonl'),
+    'xml': (mal_xml_head, mal_xml_line, '</myanimelist>\n', 'application/xml', 'xml'),
+}
+
+
+def export(user, export_format):
+    head, line, tail = EXPORTERS[export_format][:3]
+    if head:
+        yield head(user)
+    for row in _rows(user).iterator(chunk_size=CHUNK_SIZE):
+        yield line(row)
+    if tail:
+        yield tail
+
+
+async def aexport(user, export_format):
+    head, line, tail = EXPORTERS[export_format][:3]
+    if head:
+        yield head(user)
+    async for row in _rows(user).aiterator(chunk_size=CHUNK_SIZE):
+        yield line(row)
+    if tail:
+        yield tail
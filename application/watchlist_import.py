@@ -0,0 +1,273 @@
+"""
+Bulk watchlist import from MyAnimeList XML and AniList JSON exports.
+
+Both formats are parsed incrementally from a binary file object (gzipped
+exports are unpacked on the fly), so memory stays flat however long the
+list is. Entries are resolved against the local catalog for titles, images
+and episode counts, then written in chunks with one
+``INSERT ... ON CONFLICT`` each. Nothing here calls Jikan.
+"""
+import gzip
+import io
+import json
+import math
+import xml.etree.ElementTree as ElementTree
+
+from django.db import transaction
+
+from application import stats, title_index
+from application.models import Anime, Watchlist
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+
+MAL_STATUSES = {
+    'watching': 'watching', '1': 'watching',
+    'completed': 'completed', '2': 'completed',
+    'on-hold': 'on_hold', 'on hold': 'on_hold', '3': 'on_hold',
+    'dropped': 'dropped', '4': 'dropped',
+    'plan to watch': 'plan_to_watch', '6': 'plan_to_watch',
+}
+ANILIST_STATUSES = {
+    'CURRENT': 'watching', 'REPEATING': 'watching', 'COMPLETED': 'completed',
+    'PAUSED': 'on_hold', 'DROPPED': 'dropped', 'PLANNING': 'plan_to_watch',
+}
+# Columns an import overwrites on existing rows; is_favorite and added_at are kept
+UPDATE_FIELDS = ['title', 'image_url', 'status', 'rating', 'total_episodes']
+
+
+class ImportFormatError(ValueError):
+    """Raised when an export can't be recognised or parsed."""
+
+
+def open_export(fileobj):
+    """Wrap ``fileobj`` so gzip exports read transparently; returns ``(stream, format)``."""
+    stream = io.BufferedReader(fileobj) if not hasattr(fileobj, 'peek') else fileobj
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    head = stream.peek(64).lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head.startswith(b'<'):
+        return stream, 'mal'
+    if head[:1] in (b'{', b'['):
+        return stream, 'anilist'
+    raise ImportFormatError("Expected a MyAnimeList XML or AniList JSON export")
+
+
+def _positive_int(value):
+    """``value`` as a positive int, or None when it is missing or malformed."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def _score(value):
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score) or score <= 0:
+        return None
+    # AniList exports may use a 100-point scale
+    return round(score / 10, 1) if score > 10 else score
+
+
+def parse_mal(stream):
+    """Yield import entries from a MyAnimeList XML export, one ``<anime>`` element at a time."""
+    root = None
+    try:
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event != 'end' or element.tag != 'anime':
+                continue
+            fields = {child.tag: (child.text or '').strip() for child in element}
+            # Drop parsed entries so the tree never grows past one <anime>
+            root.clear()
+            # Malformed numbers don't fail the import: a bad id leaves the entry
+            # to title resolution (or the skipped count), a bad episode count is unknown
+            yield {
+                'mal_id': _positive_int(fields.get('series_animedb_id')),
+                'title': fields.get('series_title', ''),
+                'status': MAL_STATUSES.get(fields.get('my_status', '').lower()),
+                'rating': _score(fields.get('my_score')),
+                'episodes': _positive_int(fields.get('series_episodes')) or 0,
+            }
+    except ElementTree.ParseError as exc:
+        raise ImportFormatError(f"Invalid MyAnimeList XML: {exc}") from exc
+
+
+def iter_json_array(stream, key):
+    """
+    Yield the items of every JSON array stored under ``key`` (or of a
+    top-level array) without loading the whole document. Only one item is
+    held in memory at a time.
+    """
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = reader.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def read_items():
+        nonlocal pos
+        pos += 1  # '['
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ImportFormatError("Unexpected end of JSON export")
+            if buffer[pos] == ']':
+                pos += 1
+                return
+            if buffer[pos] == ',':
+                pos += 1
+                continue
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # A bare number running to the end of the buffer may be cut short
+                    if end < len(buffer) or eof:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise ImportFormatError("Invalid JSON in export")
+                fill()
+            pos = end
+            yield item
+
+    fill()
+    skip_whitespace()
+    if buffer[pos:pos + 1] == '[':
+        yield from read_items()
+        return
+
+    # Scan for `"key": [` outside string literals
+    last_string = None
+    while True:
+        if pos >= len(buffer):
+            if eof:
+                return
+            fill()
+            continue
+        char = buffer[pos]
+        if char == '"':
+            try:
+                last_string, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ImportFormatError("Invalid JSON in export")
+                fill()
+                continue
+            pos = end
+            continue
+        if char == '[' and last_string == key:
+            yield from read_items()
+        elif char not in ': \t\r\n':
+            last_string = None
+        pos += 1
+
+
+def parse_anilist(stream):
+    """Yield import entries from an AniList JSON export (``MediaListCollection`` or a plain entry list)."""
+    for entry in iter_json_array(stream, 'entries'):
+        if not isinstance(entry, dict):
+            continue
+        media = entry.get('media') or {}
+        titles = media.get('title') or {}
+        yield {
+            'mal_id': _positive_int(media.get('idMal')),
+            'title': titles.get('english') or titles.get('romaji') or titles.get('userPreferred') or '',
+            'status': ANILIST_STATUSES.get(entry.get('status')),
+            'rating': _score(entry.get('score')),
+            'episodes': _positive_int(media.get('episodes')) or 0,
+            'image_url': (media.get('coverImage') or {}).get('large') or '',
+        }
+
+
+PARSERS = {'mal': parse_mal, 'anilist': parse_anilist}
+
+
+def _resolve_chunk(user, entries):
+    """Build ``Watchlist`` rows for a chunk, filling gaps from the catalog and title index."""
+    for entry in entries:
+        if not entry['mal_id'] and entry['title']:
+            match = title_index.resolve(entry['title'])
+            if match:
+                entry['mal_id'] = match[0]
+    entries = [entry for entry in entries if entry['mal_id']]
+    catalog = {
+        anime.mal_id: anime
+        for anime in Anime.objects.filter(mal_id__in=[entry['mal_id'] for entry in entries]).only(
+            'mal_id', 'title', 'title_english', 'image_url', 'episodes'
+        )
+    }
+    rows = {}
+    for entry in entries:
+        anime = catalog.get(entry['mal_id'])
+        rows[entry['mal_id']] = Watchlist(
+            user=user,
+            mal_id=entry['mal_id'],
+            title=(anime.display_title if anime else entry['title'])[:255],
+            image_url=(anime.image_url if anime else '') or entry.get('image_url', ''),
+            status=entry['status'] or 'plan_to_watch',
+            rating=entry['rating'],
+            total_episodes=(anime.episodes if anime else 0) or entry['episodes'],
+        )
+    return list(rows.values())
+
+
+def import_watchlist(user, fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Import an export file into ``user``'s watchlist.
+
+    Returns ``(imported, skipped)`` counts; entries with no resolvable
+    MyAnimeList id are skipped. Raises ``ImportFormatError`` for files that
+    aren't a supported export. The import runs in one transaction, so a file
+    that turns out to be broken partway through leaves the watchlist as it was.
+    """
+    stream, export_format = open_export(fileobj)
+    with transaction.atomic():
+        return _import(user, stream, export_format, chunk_size)
+
+
+def _import(user, stream, export_format, chunk_size):
+    imported = skipped = 0
+    chunk = []
+
+    def flush():
+        nonlocal imported, skipped
+        rows = _resolve_chunk(user, chunk)
+        Watchlist.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'mal_id'],
+            update_fields=UPDATE_FIELDS,
+        )
+        imported += len(rows)
+        skipped += len(chunk) - len(rows)
+        chunk.clear()
+
+    for entry in PARSERS[export_format](stream):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    stats.rebuild_watchlist_stats(user.id)
+    return imported, skipped
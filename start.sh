@@ -2,6 +2,7 @@
 # Run migrations
 python manage.py makemigrations --noinput
 python manage.py migrate
+python manage.py createcachetable
 
 # Collect static files
 python manage.py collectstatic --noinput
@@ -29,5 +30,21 @@ user.save()
 print(f"Superuser '{username}' ensured (created={created})")
 END
 
-# Start Gunicorn
-gunicorn Weebwatchlist.wsgi:application --bind 0.0.0.0:8000 --workers 3
\ No newline at end of file
+# Start the background job workers (timeline fan-out, notifications, watchlist
+# enrichment, counter reconciliation). Set RUN_WORKERS=0 when they run as a
+# separate process instead, e.g. the Procfile's worker entry.
+if [ "${RUN_WORKERS:-1}" != "0" ]; then
+    python manage.py run_workers --processes "${JOB_WORKERS:-2}" &
+    WORKERS_PID=$!
+    trap 'kill -TERM $WORKERS_PID 2>/dev/null; wait $WORKERS_PID' EXIT
+fi
+
+# Start the server
+# SERVER_MODE=asgi runs uvicorn workers so the async Jikan-bound views
+# (explore, fetch_more_anime, anime_details, add_to_watchlist) can keep many
+# upstream requests in flight per process instead of blocking a worker each.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    uvicorn Weebwatchlist.asgi:application --host 0.0.0.0 --port 8000 --workers 3
+else
+    gunicorn Weebwatchlist.wsgi:application --bind 0.0.0.0:8000 --workers 3
+fi
\ No newline at end of file